@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""编解码性能测试
+
+对每种输出格式、质量等级和编码预设，测量编码/解码吞吐量（百万像素/秒）、输出大小和峰值内存。
+测试图片由固定算法生成，保证在不同机器和版本之间可以复现；编码参数与转换程序完全一致
+（使用 src.converter.build_save_params）。测试图片在主进程中生成并保存为未压缩的TIFF，
+每个用例的子进程只读取它，峰值内存不包含生成图片的开销。
+
+用法（在项目根目录运行）：
+    python -m benchmarks.bench_codecs --output results.json
+    python -m benchmarks.bench_codecs --formats JPEG,WEBP --sizes 1920x1080 --repeat 5
+    python -m benchmarks.bench_codecs --compare old.json --output new.json
+    python -m benchmarks.bench_codecs --formats PNG,WEBP --presets fastest,balanced,smallest
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+from PIL import Image
+
+from src.converter import DEFAULT_ENCODER_PRESET, ENCODER_PRESETS, build_save_params
+
+ALL_FORMATS = ["JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "AVIF", "JPEG2000", "TGA", "JXL"]
+DEFAULT_SIZES = [(1920, 1080), (4000, 3000)]
+DEFAULT_QUALITIES = [50, 75, 90]
+IMAGE_KINDS = ["photo", "graphic"]
+SEED = 20250927
+
+
+def make_image(kind, size):
+    """按固定算法生成测试图片
+
+    photo：分形纹理 + 渐变 + 固定种子的噪声，模拟照片（RGB）
+    graphic：纯色块和透明背景，模拟图标/截图（RGBA）
+    """
+    width, height = size
+    if kind == "photo":
+        fractal = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 64)
+        gradient = Image.linear_gradient("L").resize(size)
+        rng = random.Random(SEED)
+        noise = Image.frombytes("L", size, rng.getrandbits(8 * width * height).to_bytes(width * height, "little"))
+        noise = Image.blend(fractal, noise, 0.15)
+        return Image.merge("RGB", (fractal, gradient, noise))
+
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    rng = random.Random(SEED)
+    for _ in range(64):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = min(width, x0 + rng.randrange(1, width // 4 + 2)), min(height, y0 + rng.randrange(1, height // 4 + 2))
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+        img.paste(color, (x0, y0, x1, y1))
+    return img
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），无法获取时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位为KB，macOS 上为字节
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def write_source(kind, size, output_format, directory):
+    """生成测试图片并保存为未压缩的TIFF，返回文件路径
+
+    JPEG不支持透明通道，为其另存一份RGB图片，子进程中不需要再转换。
+    """
+    rgb = output_format.lower() == "jpeg"
+    path = os.path.join(directory, f"{kind}_{size[0]}x{size[1]}{'_rgb' if rgb else ''}.tiff")
+    if not os.path.exists(path):
+        img = make_image(kind, size)
+        if rgb and img.mode == "RGBA":
+            img = img.convert("RGB")
+        img.save(path, format="TIFF", compression="raw")
+    return path
+
+
+def run_case(output_format, quality, source_file, repeat, preset=DEFAULT_ENCODER_PRESET):
+    """在独立的子进程中运行一个测试用例，使峰值内存互不影响
+
+    peak_rss_mb 为子进程的峰值内存，codec_rss_mb 为编码/解码在读入测试图片之后额外占用的峰值内存。
+    """
+    try:
+        save_params = build_save_params(output_format, quality if quality is not None else 90, preset)
+    except Exception as e:
+        return {"status": "skipped", "reason": str(e)}
+
+    img = Image.open(source_file)
+    img.load()  # 未压缩的TIFF直接读入图像内存，不产生额外的副本
+    size = img.size
+    megapixels = size[0] * size[1] / 1e6
+    baseline = peak_rss_mb()
+
+    encode_times = []
+    decode_times = []
+    data = b""
+    try:
+        for _ in range(repeat):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            img.save(buffer, **save_params)
+            encode_times.append(time.perf_counter() - start)
+            data = buffer.getvalue()
+
+            start = time.perf_counter()
+            with Image.open(io.BytesIO(data)) as decoded:
+                decoded.load()
+            decode_times.append(time.perf_counter() - start)
+    except Exception as e:
+        return {"status": "skipped", "reason": f"{type(e).__name__}: {e}"}
+
+    peak = peak_rss_mb()
+    # 取最快的一次，减少系统噪声的影响
+    return {
+        "status": "ok",
+        "encode_mp_s": round(megapixels / min(encode_times), 3),
+        "decode_mp_s": round(megapixels / min(decode_times), 3),
+        "encode_ms": round(min(encode_times) * 1000, 3),
+        "decode_ms": round(min(decode_times) * 1000, 3),
+        "output_bytes": len(data),
+        "bits_per_pixel": round(len(data) * 8 / (size[0] * size[1]), 4),
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "codec_rss_mb": round(peak - baseline, 1) if peak is not None else None,
+    }
+
+
+def iter_cases(formats, sizes, qualities, presets):
+    """枚举测试用例；无损格式不区分质量等级，编码预设不影响的格式只测试默认预设"""
+    for output_format in formats:
+        try:
+            lossy = "quality" in build_save_params(output_format, 90)
+        except Exception:
+            lossy = False
+        format_presets = [p for p in presets if p == DEFAULT_ENCODER_PRESET or ENCODER_PRESETS[p].get(output_format)]
+        for preset in format_presets or [DEFAULT_ENCODER_PRESET]:
+            for kind in IMAGE_KINDS:
+                for size in sizes:
+                    for quality in (qualities if lossy else [None]):
+                        yield output_format, quality, kind, size, preset
+
+
+def case_key(case):
+    # 之前版本的结果没有编码预设，视为默认预设
+    preset = case.get("preset", DEFAULT_ENCODER_PRESET)
+    return f"{case['format']}|q={case['quality']}|{preset}|{case['image']}|{case['width']}x{case['height']}"
+
+
+def print_comparison(results, baseline):
+    """与之前的结果比较，输出吞吐量和大小的变化比例"""
+    previous = {case_key(case): case for case in baseline.get("cases", [])}
+    print()
+    print(f"{'用例':<50}{'编码':>10}{'解码':>10}{'大小':>10}")
+    for case in results["cases"]:
+        old = previous.get(case_key(case))
+        if case["status"] != "ok" or old is None or old.get("status") != "ok":
+            continue
+        print(f"{case_key(case):<50}"
+              f"{case['encode_mp_s'] / old['encode_mp_s']:>9.2f}x"
+              f"{case['decode_mp_s'] / old['decode_mp_s']:>9.2f}x"
+              f"{case['output_bytes'] / old['output_bytes']:>9.2f}x")
+
+
+def parse_sizes(text):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in text.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="图片编解码性能测试")
+    parser.add_argument("--formats", default=",".join(ALL_FORMATS), help="要测试的格式，逗号分隔")
+    parser.add_argument("--sizes", default=",".join(f"{w}x{h}" for w, h in DEFAULT_SIZES), help="图片尺寸，如 1920x1080,4000x3000")
+    parser.add_argument("--qualities", default=",".join(str(q) for q in DEFAULT_QUALITIES), help="有损格式的质量等级")
+    parser.add_argument("--presets", default=DEFAULT_ENCODER_PRESET,
+                        help=f"编码预设，逗号分隔（可选 {','.join(ENCODER_PRESETS)}）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数（取最快一次）")
+    parser.add_argument("--output", help="结果保存路径（JSON）")
+    parser.add_argument("--compare", help="与之前保存的结果（JSON）比较")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip().upper() for f in args.formats.split(",") if f.strip()]
+    sizes = parse_sizes(args.sizes)
+    qualities = [int(q) for q in args.qualities.split(",") if q]
+    presets = [p.strip().lower() for p in args.presets.split(",") if p.strip()]
+    for preset in presets:
+        if preset not in ENCODER_PRESETS:
+            parser.error(f"未知的编码预设: {preset}")
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "seed": SEED,
+        "cases": [],
+    }
+
+    print(f"{'格式':<10}{'质量':>6}{'预设':>10}{'图片':>9}{'尺寸':>11}{'编码MP/s':>10}{'解码MP/s':>10}{'大小KB':>10}{'编解码MB':>10}")
+    # 测试图片在主进程中生成，子进程只读取，峰值内存不包含生成的开销
+    with tempfile.TemporaryDirectory(prefix="bench_codecs_") as source_dir:
+        for output_format, quality, kind, size, preset in iter_cases(formats, sizes, qualities, presets):
+            source_file = write_source(kind, size, output_format, source_dir)
+            # 每个用例使用新的子进程，峰值内存只反映该用例
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                measurement = executor.submit(run_case, output_format, quality, source_file, args.repeat, preset).result()
+
+            case = {"format": output_format, "quality": quality, "preset": preset, "image": kind, "width": size[0], "height": size[1]}
+            case.update(measurement)
+            results["cases"].append(case)
+
+            size_text = f"{size[0]}x{size[1]}"
+            if measurement["status"] != "ok":
+                print(f"{output_format:<10}{str(quality or '-'):>6}{preset:>10}{kind:>9}{size_text:>11}  跳过: {measurement['reason']}")
+                continue
+            print(f"{output_format:<10}{str(quality or '-'):>6}{preset:>10}{kind:>9}{size_text:>11}"
+                  f"{measurement['encode_mp_s']:>10.1f}{measurement['decode_mp_s']:>10.1f}"
+                  f"{measurement['output_bytes'] / 1024:>10.1f}{measurement['codec_rss_mb'] or 0:>10.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import Qt, QCoreApplication
 
@@ -34,4 +35,6 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # 打包为exe后，转换进程池的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""图片转换库接口
+
+供其他程序嵌入使用的纯Python接口，不依赖PyQt5，导入时只加载Pillow：
+
+    from src.api import ConversionOptions, convert_many
+
+    options = ConversionOptions("D:/输出", output_format="WEBP", quality=80, resize_option="width", resize_width=1024)
+    for result in convert_many(paths, options):
+        if result.ok:
+            print(result.output, result.output_bytes)
+        else:
+            print(result.input, result.stage, result.error)
+
+结果按完成顺序逐个产生；可以通过 executor 参数传入自己的执行器（如线程池或共享的进程池）。
+"""
+
+from src.converter import DEFAULT_ENCODER_PRESET, conversion_params
+from src.engine import BatchConverter
+from src.fileops import DEFAULT_SYNC_EVERY
+
+
+class ConversionOptions:
+    """转换参数（与设置文件中的同名设置含义相同）"""
+
+    def __init__(self, output_dir, output_format="JPEG", quality=90, resize_option="none", resize_width=800, resize_height=600,
+                 overwrite_files=True, incremental=False, continue_on_error=True, max_workers=None, timing_log=None, journal=False,
+                 memory_budget=None, output_targets=None, max_bytes=None, pass_through="copy",
+                 encoder_preset=DEFAULT_ENCODER_PRESET, deduplicate="off", prefetch=0, durability="none",
+                 sync_every=DEFAULT_SYNC_EVERY):
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.quality = quality
+        self.resize_option = resize_option
+        self.resize_width = resize_width
+        self.resize_height = resize_height
+        self.max_bytes = max_bytes  # 输出文件大小上限（字节），JPEG/WEBP/AVIF/JXL超出时自动降低质量，None表示不限制
+        # 输入已经是目标格式且不需要缩放时："copy" 直接复制（支持时使用reflink），"hardlink" 创建硬链接，"off" 重新编码
+        self.pass_through = pass_through
+        self.encoder_preset = encoder_preset  # 编码预设："fastest" / "balanced" / "smallest"
+        # 内容相同的输入只转换一次，其余的输出 "copy" 复制或 "hardlink" 硬链接，"off" 表示不去重
+        self.deduplicate = deduplicate
+        self.overwrite_files = overwrite_files
+        self.incremental = incremental
+        self.continue_on_error = continue_on_error
+        self.max_workers = max_workers  # None表示CPU核心数
+        self.timing_log = timing_log  # 各阶段耗时日志文件（JSON Lines）
+        self.journal = journal  # 是否在输出目录中写入批次日志（用于中断后继续）
+        self.memory_budget = memory_budget  # 同时转换的文件预计占用内存的上限（字节），None表示不限制
+        self.prefetch = prefetch  # 在后台提前读取之后的多少个文件（输入位于网络共享上时有用），0表示不预读
+        # 输出写入磁盘的方式："none" 由系统决定，"batch" 每 sync_every 个文件同步一次，"file" 每个文件写入后立即同步
+        self.durability = durability
+        self.sync_every = sync_every
+        # 多输出：输出目标列表，元素为描述字符串（如 "WEBP:80:width=1024"）或 src.converter.output_target() 的字典；
+        # 指定后每个文件只解码一次，生成全部输出，忽略上面的单一格式和尺寸
+        self.output_targets = output_targets
+
+    @classmethod
+    def fromSettings(cls, settings, output_dir=None):
+        """由图形界面的设置字典（settings.json）创建"""
+        return cls(
+            output_dir or settings.get("default_output_dir"),
+            output_format=settings.get("output_format", "JPEG"),
+            quality=settings.get("output_quality", 90),
+            resize_option=settings.get("resize_option", "none"),
+            resize_width=settings.get("output_width", 800),
+            resize_height=settings.get("output_height", 600),
+            max_bytes=(settings.get("max_output_kb") or 0) * 1024 or None,
+            pass_through=settings.get("pass_through", "copy"),
+            encoder_preset=settings.get("encoder_preset", DEFAULT_ENCODER_PRESET),
+            deduplicate=settings.get("deduplicate", "off"),
+            overwrite_files=settings.get("overwrite_files", False),
+            incremental=settings.get("incremental", False),
+            continue_on_error=settings.get("continue_on_error", True),
+            max_workers=settings.get("max_workers") or None,
+            memory_budget=(settings.get("memory_budget_mb") or 0) * 1024 * 1024 or None,
+            prefetch=settings.get("prefetch_files", 0),
+            durability=settings.get("durability", "none"),
+            output_targets=settings.get("output_targets") or None,
+        )
+
+    def __repr__(self):
+        params = conversion_params(
+            self.output_format, self.quality, self.resize_option, self.resize_width, self.resize_height, self.max_bytes,
+            self.encoder_preset
+        )
+        return f"ConversionOptions(output_dir={self.output_dir!r}, {params})"
+
+
+class ConversionResult:
+    """单个文件的转换结果"""
+
+    def __init__(self, status, input, output=None, input_bytes=None, output_bytes=None, timings=None, stage=None, error=None,
+                 quality=None, quality_trials=None):
+        self.status = status  # "converted" / "skipped" / "failed"
+        self.input = input
+        self.output = output  # 多输出时为输出路径列表
+        self.input_bytes = input_bytes
+        self.output_bytes = output_bytes
+        self.quality = quality  # 按文件大小上限选择的质量
+        self.quality_trials = quality_trials  # 选择质量时的编码次数
+        self.timings = timings or {}  # 各阶段耗时（秒）
+        self.stage = stage  # 失败时所处的阶段
+        self.error = error  # 失败时的错误信息
+
+    @property
+    def ok(self):
+        """转换成功或无需转换"""
+        return self.status != "failed"
+
+    @classmethod
+    def fromDict(cls, result):
+        return cls(
+            result["status"], result["input"], output=result.get("output"),
+            input_bytes=result.get("input_bytes"), output_bytes=result.get("output_bytes"),
+            timings=result.get("timings"), stage=result.get("stage"), error=result.get("error"),
+            quality=result.get("quality"), quality_trials=result.get("quality_trials"),
+        )
+
+    def toDict(self):
+        return {key: value for key, value in vars(self).items() if value is not None}
+
+    def __repr__(self):
+        if self.status == "failed":
+            return f"ConversionResult(failed, {self.input!r}, stage={self.stage!r}, error={self.error!r})"
+        return f"ConversionResult({self.status}, {self.input!r} -> {self.output!r})"
+
+
+def convert_many(paths, options, executor=None):
+    """批量转换，按完成顺序逐个产生 ConversionResult
+
+    executor 为 None 时使用新的进程池（大小由 options.max_workers 决定）；也可以传入任意
+    concurrent.futures 执行器，此时执行器由调用方负责关闭。提前结束迭代会停止提交新任务。
+    options.continue_on_error 为 False 时，第一个失败的文件会抛出 ConversionError。
+    """
+    converter = BatchConverter(
+        list(paths), options.output_dir, options.output_format, options.quality,
+        options.resize_option, options.resize_width, options.resize_height, max_bytes=options.max_bytes,
+        pass_through=options.pass_through, encoder_preset=options.encoder_preset,
+        deduplicate=options.deduplicate, max_workers=options.max_workers, overwrite_files=options.overwrite_files,
+        incremental=options.incremental, continue_on_error=options.continue_on_error,
+        timing_log=options.timing_log, executor=executor, journal=options.journal,
+        memory_budget=options.memory_budget, output_targets=options.output_targets, prefetch=options.prefetch,
+        durability=options.durability, sync_every=options.sync_every
+    )
+    results = converter.iterResults()
+    try:
+        for result in results:
+            yield ConversionResult.fromDict(result)
+    finally:
+        converter.stop()
+        results.close()
+
+
+def convert_one(path, options):
+    """转换单个文件（在当前进程中同步执行）"""
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return next(convert_many([path], options, executor=executor))
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""命令行批量转换工具
+
+与图形界面共用同一套转换引擎（src.engine.BatchConverter），但不导入PyQt5，
+适合在没有显示器的服务器上运行。每个文件处理完成后立即输出一行结果。
+
+用法（在项目根目录运行）：
+    python -m src.convert 输入文件或目录... -o 输出目录 [-f JPEG] [-q 90] [--resize width --width 800]
+    python -m src.convert -o 输出目录 --resume
+    python -m src.convert 导入目录... -o 输出目录 --watch
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+
+from src.converter import (
+    DEFAULT_ENCODER_PRESET, ENCODER_PRESETS, OUTPUT_FORMATS, byte_size, is_image_file, normalize_output_targets
+)
+from src.dedup import DEDUP_MODES
+from src.engine import BatchConverter
+from src.fileops import DEFAULT_SYNC_EVERY, DURABILITY_MODES, PASS_THROUGH_MODES
+from src.journal import load_unfinished_batch
+from src.prefetch import DEFAULT_PREFETCH_BYTES
+from src.watcher import FolderWatcher
+
+
+def collect_input_files(paths, recursive=True):
+    """展开输入路径：文件直接使用，目录中按扩展名查找图片文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, file_names in os.walk(path):
+                    for file_name in sorted(file_names):
+                        if is_image_file(file_name):
+                            files.append(os.path.join(root, file_name))
+            else:
+                for file_name in sorted(os.listdir(path)):
+                    file_path = os.path.join(path, file_name)
+                    if os.path.isfile(file_path) and is_image_file(file_name):
+                        files.append(file_path)
+        else:
+            files.append(path)
+    return files
+
+
+def load_settings_defaults(settings_file):
+    """从图形界面的设置文件读取默认转换参数"""
+    with open(settings_file, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    return {
+        "format": settings.get("output_format"),
+        "quality": settings.get("output_quality"),
+        "resize": settings.get("resize_option"),
+        "width": settings.get("output_width"),
+        "height": settings.get("output_height"),
+        "max_size": (settings.get("max_output_kb") or 0) * 1024 or None,
+        "pass_through": settings.get("pass_through"),
+        "preset": settings.get("encoder_preset"),
+        "dedup": settings.get("deduplicate"),
+        "overwrite": settings.get("overwrite_files"),
+        "incremental": settings.get("incremental"),
+        "workers": settings.get("max_workers") or None,
+        "memory_budget": settings.get("memory_budget_mb") or None,
+        "prefetch": settings.get("prefetch_files"),
+        "durability": settings.get("durability"),
+        "targets": settings.get("output_targets") or None,
+    }
+
+
+def format_result(result):
+    """单个文件结果的可读文本"""
+    if result["status"] == "converted":
+        total_ms = sum(result["timings"].values()) * 1000
+        output = ", ".join(result["output"]) if isinstance(result["output"], list) else result["output"]
+        text = f"OK      {result['input']} -> {output} ({total_ms:.0f} ms, {result['output_bytes']} B"
+        if "quality_trials" in result:
+            text += f", 质量 {result['quality']}, 尝试 {result['quality_trials']} 次"
+            if result.get("over_size_limit"):
+                text += ", 仍超出大小上限"
+        if result.get("deduplicated_from"):
+            text += f", 与 {result['deduplicated_from']} 内容相同"
+        return text + ")"
+    elif result["status"] == "skipped":
+        return f"SKIP    {result['input']}"
+    return f"FAILED  {result['input']} [{result['stage']}]: {result['error']}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.convert", description="图片批量转换（命令行）")
+    parser.add_argument("inputs", nargs="*", help="输入文件或目录")
+    parser.add_argument("-o", "--output-dir", required=True, help="输出目录")
+    parser.add_argument("-f", "--format", type=str.upper, choices=OUTPUT_FORMATS, default="JPEG", help="输出格式（默认JPEG）")
+    parser.add_argument("-q", "--quality", type=int, default=90, help="输出质量 1-100（默认90）")
+    parser.add_argument("--resize", choices=["none", "width", "height", "both"], default="none", help="尺寸调整方式（默认none）")
+    parser.add_argument("--width", type=int, default=800, help="目标宽度（默认800）")
+    parser.add_argument("--height", type=int, default=600, help="目标高度（默认600）")
+    parser.add_argument("--max-size", type=byte_size, default=None, metavar="大小",
+                        help="输出文件大小上限，如 200KB、1.5MB；JPEG/WEBP/AVIF/JXL超出时自动降低质量（以 -q 为最高质量）")
+    parser.add_argument("--preset", choices=list(ENCODER_PRESETS), default=DEFAULT_ENCODER_PRESET,
+                        help="编码预设：fastest 编码最快，smallest 输出最小，balanced 两者兼顾（默认）")
+    parser.add_argument("--pass-through", choices=PASS_THROUGH_MODES, default="copy",
+                        help="输入已经是目标格式且不需要缩放时：copy 直接复制（支持时使用reflink），hardlink 创建硬链接，"
+                             "off 总是重新编码（默认copy）")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default="off",
+                        help="内容相同的输入只转换一次，其余的输出 copy 复制或 hardlink 硬链接（默认off）")
+    parser.add_argument("-t", "--target", dest="targets", action="append", metavar="格式[:质量][:尺寸]",
+                        help="多输出：每张图片解码一次，生成多个输出，可重复指定，如 -t JPEG:90:width=2048 -t WEBP:80:width=1024 "
+                             "-t AVIF:60:512x512 -t JPEG:90:width=1080:max=200KB（指定后忽略 -f/-q/--resize/--max-size）")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数（默认CPU核心数）")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MB",
+                        help="同时转换的图片预计占用内存的上限（MB），超出时等待其他文件完成（默认不限制）")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="在后台提前读取之后的N个文件，输入位于网络共享或机械硬盘上时使转换与读取重叠（默认0，不预读）")
+    parser.add_argument("--prefetch-budget", type=int, default=DEFAULT_PREFETCH_BYTES // (1024 * 1024), metavar="MB",
+                        help=f"已预读但尚未转换完成的文件总大小上限（默认{DEFAULT_PREFETCH_BYTES // (1024 * 1024)}MB）")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="none",
+                        help="输出写入磁盘的方式：none 由系统决定（最快），batch 每 --sync-every 个文件同步一次，"
+                             "file 每个文件写入后立即同步（最安全）；输出总是先写临时文件再重命名（默认none）")
+    parser.add_argument("--sync-every", type=int, default=DEFAULT_SYNC_EVERY, metavar="N",
+                        help=f"--durability batch 时每完成多少个文件同步一次（默认{DEFAULT_SYNC_EVERY}）")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false", help="不递归查找子目录")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的同名文件")
+    parser.add_argument("--incremental", action="store_true", help="跳过已转换且未修改的文件")
+    parser.add_argument("--stop-on-error", action="store_true", help="任意文件失败时中止整个批次")
+    parser.add_argument("--resume", action="store_true", help="继续输出目录中未完成的批次（使用原批次的参数）")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视输入目录，自动转换新放入或被修改的图片（总是增量转换，Ctrl+C 停止）")
+    parser.add_argument("--poll", action="store_true",
+                        help="监视时定期扫描目录而不使用inotify（输入目录位于网络共享上时使用）")
+    parser.add_argument("--timing-log", help="把每个文件的各阶段耗时追加写入该JSON Lines文件")
+    parser.add_argument("--settings", help="从图形界面的设置文件（settings.json）读取默认参数")
+    parser.add_argument("--json", action="store_true", help="每个文件输出一行JSON")
+    return parser
+
+
+def build_batch_params(args, parser):
+    """由命令行参数生成批次参数（BatchConverter 的转换参数）"""
+    batch_params = {
+        "output_format": args.format,
+        "quality": args.quality,
+        "resize_option": args.resize,
+        "resize_width": args.width,
+        "resize_height": args.height,
+        "max_bytes": args.max_size,
+        "pass_through": args.pass_through,
+        "encoder_preset": args.preset,
+        "deduplicate": args.dedup,
+        "overwrite_files": args.overwrite,
+        "incremental": args.incremental,
+        "continue_on_error": not args.stop_on_error,
+        "output_targets": None,
+    }
+    if args.targets:
+        try:
+            batch_params["output_targets"] = normalize_output_targets(args.targets, args.quality, args.preset)
+        except ValueError as e:
+            parser.error(str(e))
+    return batch_params
+
+
+def run_watch(args, batch_params):
+    """监视输入目录，直到按 Ctrl+C 或收到 SIGTERM"""
+    watcher = FolderWatcher(
+        args.inputs, args.output_dir, batch_params, recursive=args.recursive, max_workers=args.workers,
+        memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+        timing_log=args.timing_log, polling=args.poll, durability=args.durability, sync_every=args.sync_every
+    )
+    # 作为服务运行时由 SIGTERM 停止
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    print(f"正在监视 {', '.join(args.inputs)}（{watcher.mode}），按 Ctrl+C 停止", file=sys.stderr)
+    try:
+        for result in watcher.iterResults():
+            print(json.dumps(result, ensure_ascii=False) if args.json else format_result(result), flush=True)
+    except KeyboardInterrupt:
+        pass
+    print(f"已停止监视：转换 {watcher.converted_files}，跳过 {watcher.skipped_files}，失败 {watcher.failed_files}，"
+          f"平均延迟 {watcher.average_latency:.2f} 秒，最大延迟 {watcher.max_latency:.2f} 秒", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.settings:
+        # 设置文件中的值作为默认值，命令行显式给出的参数优先
+        defaults = {k: v for k, v in load_settings_defaults(args.settings).items() if v is not None}
+        # 追加型参数的默认值会与命令行的值合并，因此单独处理：命令行没有指定时才使用设置文件中的多输出
+        settings_targets = defaults.pop("targets", None)
+        parser.set_defaults(**defaults)
+        args = parser.parse_args(argv)
+        if not args.targets:
+            args.targets = settings_targets
+
+    if args.watch:
+        if args.resume:
+            parser.error("--watch 不能与 --resume 同时使用")
+        if not args.inputs or not all(os.path.isdir(path) for path in args.inputs):
+            parser.error("--watch 需要指定要监视的输入目录")
+        return run_watch(args, build_batch_params(args, parser))
+
+    if args.resume:
+        batch = load_unfinished_batch(args.output_dir)
+        if batch is None:
+            print("输出目录中没有未完成的转换批次。", file=sys.stderr)
+            return 2
+        input_files = batch["remaining_files"]
+        batch_params = batch["params"]
+    else:
+        input_files = collect_input_files(args.inputs, args.recursive)
+        if not input_files:
+            parser.error("没有找到要转换的图片文件")
+        batch_params = build_batch_params(args, parser)
+
+    converter = BatchConverter(
+        input_files, args.output_dir, max_workers=args.workers,
+        memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+        resume=args.resume, timing_log=args.timing_log, prefetch=args.prefetch,
+        prefetch_bytes=args.prefetch_budget * 1024 * 1024, durability=args.durability, sync_every=args.sync_every,
+        **batch_params
+    )
+
+    start_time = time.perf_counter()
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    try:
+        for result in converter.iterResults():
+            counts[result["status"]] += 1
+            print(json.dumps(result, ensure_ascii=False) if args.json else format_result(result), flush=True)
+    except KeyboardInterrupt:
+        # 已完成的文件记录在批次日志中，可以使用 --resume 继续
+        print("已中断，可使用 --resume 继续。", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"转换中止: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - start_time
+    summary = f"完成：转换 {counts['converted']}，跳过 {counts['skipped']}，失败 {counts['failed']}，用时 {elapsed:.1f} 秒"
+    if converter.duplicate_files:
+        summary += f"；其中 {converter.duplicate_files} 个重复文件直接复制，节省约 {converter.saved_seconds:.1f} 秒转换时间"
+    print(summary, file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
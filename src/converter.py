@@ -0,0 +1,964 @@
+# -*- coding: utf-8 -*-
+"""图片转换核心逻辑
+
+本模块不依赖PyQt5，既可以在GUI的转换线程中调用，也可以在进程池的子进程中运行。
+"""
+
+import io
+import os
+import math
+import argparse
+import time
+import threading
+from contextlib import contextmanager
+from PIL import Image
+
+from src.fileops import pass_through_file, write_output
+from src.tiled import strip_memory, supports_tiled_resize, tiled_resize
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    # Note: AVIF format uses the same opener as HEIF in current pillow_heif version
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+# 检查JXL格式支持
+try:
+    # 首先尝试直接导入PIL的JXL插件
+    from PIL import JxlImagePlugin
+    JXL_SUPPORT = True
+except ImportError:
+    try:
+        # 尝试导入Pillow-JXL-Plugin库
+        from pillow_jxl import JpegXLImagePlugin
+        JXL_SUPPORT = True
+    except ImportError:
+        try:
+            # 尝试导入pillow-jxl库
+            import pillow_jxl
+            pillow_jxl.register_jxl_opener()
+            JXL_SUPPORT = True
+        except ImportError:
+            try:
+                # 尝试另一种可能的导入方式
+                import jpegxl
+                jpegxl.register_jxl_opener()
+                JXL_SUPPORT = True
+            except ImportError:
+                JXL_SUPPORT = False
+
+
+# 扫描仪输出的超大图片（如 30000×40000）超过Pillow默认的像素数上限，打开时会被当作解压炸弹拒绝；
+# 超大的未压缩TIFF可以分段处理，内存占用由 src.tiled 控制。
+# 只在转换本地文件时（allow_large_images 范围内）放宽上限，HTTP服务收到的上传数据仍按Pillow默认上限检查
+MAX_IMAGE_PIXELS = 2_000_000_000
+
+_pixel_limit_lock = threading.Lock()
+_pixel_limit_users = 0  # 正在使用放宽上限的调用数
+_default_max_pixels = Image.MAX_IMAGE_PIXELS
+
+
+@contextmanager
+def allow_large_images():
+    """在此范围内把Pillow的像素数上限放宽到 MAX_IMAGE_PIXELS，结束后恢复（也可以作为函数装饰器）
+
+    Pillow 的上限是全局设置，打开图片、切换帧和读取TIFF分块时都会检查，因此要覆盖整个转换过程。
+    多个线程同时使用时由最后一个结束的调用恢复原来的上限；不可信的数据应在不使用本函数的进程中解码。
+    """
+    global _pixel_limit_users, _default_max_pixels
+    with _pixel_limit_lock:
+        if _pixel_limit_users == 0:
+            _default_max_pixels = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+        _pixel_limit_users += 1
+    try:
+        yield
+    finally:
+        with _pixel_limit_lock:
+            _pixel_limit_users -= 1
+            if _pixel_limit_users == 0:
+                Image.MAX_IMAGE_PIXELS = _default_max_pixels
+
+# 可以作为输入的图片扩展名
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.gif', '.webp', '.avif'}
+
+# 支持的输出格式
+OUTPUT_FORMATS = ["JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "AVIF", "JPEG2000", "TGA", "JXL"]
+
+# 可以保存多帧（动画或多页）的输出格式，其他格式只转换第一帧
+MULTI_FRAME_FORMATS = {"GIF", "WEBP", "PNG", "TIFF", "AVIF"}
+
+# 可以按文件大小上限自动选择质量的格式（质量参数决定输出大小的有损格式）
+SIZE_LIMIT_FORMATS = {"JPEG", "WEBP", "AVIF", "JXL"}
+
+# 按文件大小上限选择质量时允许的最低质量
+MIN_SEARCH_QUALITY = 1
+
+# 编码预设：在编码速度和输出大小之间取舍，值为各格式在质量之外的编码参数（未列出的格式不受影响）。
+# 各预设的实测速度和大小见 README 的"编码预设"一节（benchmarks/bench_codecs.py --presets 可以重新测量）
+ENCODER_PRESETS = {
+    "fastest": {
+        "JPEG": {"optimize": False},
+        "PNG": {"compress_level": 1},
+        "WEBP": {"method": 0},
+        "AVIF": {"speed": 8},
+        "JXL": {"effort": 3},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True},
+        "PNG": {"compress_level": 6},
+        "WEBP": {"method": 4},
+        "AVIF": {"speed": 6},
+        "JXL": {"effort": 7},
+    },
+    "smallest": {
+        "JPEG": {"optimize": True, "progressive": True},
+        "PNG": {"optimize": True},
+        "WEBP": {"method": 6},
+        "AVIF": {"speed": 4},
+        "JXL": {"effort": 9},
+    },
+}
+DEFAULT_ENCODER_PRESET = "balanced"
+
+
+def is_image_file(file_path):
+    """根据扩展名判断文件是否为图片文件"""
+    return os.path.splitext(file_path.lower())[1] in IMAGE_EXTENSIONS
+
+
+def default_worker_count():
+    """默认的并行进程数（CPU核心数）"""
+    return os.cpu_count() or 1
+
+
+def get_output_path(input_file, output_dir, output_format, suffix=""):
+    """根据输入文件名和输出格式生成输出文件路径，suffix用于区分同一输入的多个同格式输出"""
+    # 获取文件名（不含扩展名）
+    filename = os.path.splitext(os.path.basename(input_file))[0]
+    if suffix:
+        filename = f"{filename}_{suffix}"
+    return os.path.join(output_dir, f"{filename}.{output_format.lower()}")
+
+
+def conversion_params(output_format, quality, resize_option, resize_width, resize_height, max_bytes=None,
+                      encoder_preset=DEFAULT_ENCODER_PRESET):
+    """影响转换结果的全部参数，用于判断已有的输出是否仍然有效"""
+    params = {
+        "output_format": output_format.upper(),
+        "quality": quality,
+        "resize_option": resize_option,
+        "resize_width": resize_width,
+        "resize_height": resize_height,
+    }
+    # 只在设置了文件大小上限或非默认的编码预设时记录，否则与之前版本的转换清单保持一致
+    if max_bytes:
+        params["max_bytes"] = max_bytes
+    if encoder_preset != DEFAULT_ENCODER_PRESET:
+        params["encoder_preset"] = encoder_preset
+    return params
+
+
+def parse_byte_size(text):
+    """解析文件大小，如 "200KB"、"1.5MB" 或字节数 "180000"，格式不正确时抛出ValueError"""
+    units = {"KB": 1024, "K": 1024, "MB": 1024 * 1024, "M": 1024 * 1024, "B": 1}
+    text = str(text).strip().upper()
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            number, multiplier = text[:-len(unit)].strip(), factor
+            break
+    else:
+        number, multiplier = text, 1
+    try:
+        size = int(float(number) * multiplier)
+    except ValueError:
+        raise ValueError(f"无法解析文件大小: {text}") from None
+    if size <= 0:
+        raise ValueError(f"文件大小必须大于0: {text}")
+    return size
+
+
+def format_byte_size(size):
+    """文件大小的描述字符串（parse_byte_size的逆操作）"""
+    if size % (1024 * 1024) == 0:
+        return f"{size // (1024 * 1024)}MB"
+    elif size % 1024 == 0:
+        return f"{size // 1024}KB"
+    return str(size)
+
+
+def byte_size(text):
+    """argparse使用的文件大小参数类型（命令行工具和HTTP服务共用）"""
+    try:
+        return parse_byte_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def output_target(output_format, quality, resize_option="none", resize_width=0, resize_height=0, suffix="", max_bytes=None,
+                  encoder_preset=None):
+    """一个输出目标（多输出模式下每个输入文件生成的一种输出），encoder_preset 为None时使用批次的编码预设"""
+    target = conversion_params(output_format, quality, resize_option, resize_width, resize_height, max_bytes)
+    target["encoder_preset"] = encoder_preset
+    target["suffix"] = suffix
+    return target
+
+
+def parse_output_target(text, default_quality=90):
+    """解析输出目标描述，格式为 格式[:质量][:尺寸][:max=大小][:编码预设]
+
+    尺寸可以是 none、width=宽度、height=高度 或 宽度x高度，max 为文件大小上限，编码预设为 ENCODER_PRESETS 之一，
+    例如 "WEBP:80:width=1024"、"AVIF:60:512x512"、"JPEG:90:width=1080:max=200KB"、"PNG:smallest"。
+    格式不正确时抛出ValueError。
+    """
+    parts = [part.strip() for part in text.strip().split(":")]
+    output_format = parts[0].upper()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {parts[0]}")
+
+    quality = default_quality
+    resize = ("none", 0, 0)
+    max_bytes = None
+    encoder_preset = None
+    try:
+        for part in parts[1:]:
+            lower = part.lower()
+            if lower in ENCODER_PRESETS:
+                encoder_preset = lower
+            elif lower.startswith("max="):
+                max_bytes = parse_byte_size(lower[4:])
+            elif lower.isdigit():
+                quality = int(lower)
+            elif lower == "none":
+                resize = ("none", 0, 0)
+            elif lower.startswith("width="):
+                resize = ("width", int(lower[6:]), 0)
+            elif lower.startswith("height="):
+                resize = ("height", 0, int(lower[7:]))
+            elif "x" in lower:
+                width, height = lower.split("x")
+                resize = ("both", int(width), int(height))
+            else:
+                raise ValueError
+    except ValueError:
+        raise ValueError(f"无法解析输出目标: {text}") from None
+    return output_target(output_format, quality, *resize, max_bytes=max_bytes, encoder_preset=encoder_preset)
+
+
+def normalize_output_targets(targets, default_quality=90, default_preset=DEFAULT_ENCODER_PRESET):
+    """把输出目标列表（描述字符串或字典）整理为字典列表，补全编码预设，并为同格式的输出分配文件名后缀"""
+    targets = [
+        parse_output_target(t, default_quality) if isinstance(t, str) else output_target(**t)
+        for t in targets
+    ]
+    for target in targets:
+        target["encoder_preset"] = target["encoder_preset"] or default_preset
+        if target["encoder_preset"] not in ENCODER_PRESETS:
+            raise ValueError(f"未知的编码预设: {target['encoder_preset']}")
+
+    def size_label(target):
+        if target["resize_option"] == "width":
+            return f"{target['resize_width']}w"
+        elif target["resize_option"] == "height":
+            return f"{target['resize_height']}h"
+        elif target["resize_option"] == "both":
+            return f"{target['resize_width']}x{target['resize_height']}"
+        return "full"
+
+    # 同格式的多个输出用它们之间不同的属性（尺寸、质量、大小上限、编码预设）区分，如 1024w、q80、smallest
+    labels = (
+        size_label,
+        lambda t: f"q{t['quality']}",
+        lambda t: f"max{format_byte_size(t['max_bytes'])}" if t.get("max_bytes") else "",
+        lambda t: t["encoder_preset"],
+    )
+    for output_format in {t["output_format"] for t in targets}:
+        group = [t for t in targets if t["output_format"] == output_format]
+        if len(group) == 1:
+            continue
+        varying = [label for label in labels if len({label(t) for t in group}) > 1]
+        for index, target in enumerate(group):
+            if not target["suffix"]:
+                parts = [label(target) for label in varying if label(target)]
+                target["suffix"] = "_".join(parts) if parts else str(index + 1)
+    return targets
+
+
+def format_output_target(target):
+    """输出目标的描述字符串（parse_output_target的逆操作）"""
+    text = f"{target['output_format']}:{target['quality']}"
+    if target["resize_option"] == "width":
+        text += f":width={target['resize_width']}"
+    elif target["resize_option"] == "height":
+        text += f":height={target['resize_height']}"
+    elif target["resize_option"] == "both":
+        text += f":{target['resize_width']}x{target['resize_height']}"
+    if target.get("max_bytes"):
+        text += f":max={format_byte_size(target['max_bytes'])}"
+    if target.get("encoder_preset") and target["encoder_preset"] != DEFAULT_ENCODER_PRESET:
+        text += f":{target['encoder_preset']}"
+    return text
+
+
+def flatten_alpha(img, output_format):
+    """处理透明通道（如果是PNG转JPEG）"""
+    if img.mode in ('RGBA', 'LA') and output_format.lower() == 'jpeg':
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    return img
+
+
+# 缩放时先用整数倍快速缩小（Image.reduce）到目标尺寸的若干倍，再做LANCZOS重采样
+# 取值3.0时画质与直接LANCZOS缩放几乎没有区别，但大幅缩小时速度快很多
+REDUCING_GAP = 3.0
+
+
+def get_target_size(size, resize_option, resize_width, resize_height):
+    """根据原图尺寸和尺寸调整选项计算目标尺寸，不调整时返回None"""
+    width, height = size
+    if resize_option == "width":
+        width_percent = (resize_width / float(width))
+        height_size = int((float(height) * float(width_percent)))
+        return (resize_width, height_size)
+    elif resize_option == "height":
+        height_percent = (resize_height / float(height))
+        width_size = int((float(width) * float(height_percent)))
+        return (width_size, resize_height)
+    elif resize_option == "both":
+        return (resize_width, resize_height)
+    return None
+
+
+def jpeg2000_reduce_level(size, target_size):
+    """JPEG2000按分辨率层级解码时，不小于目标尺寸的最高层级（每级缩小1/2）
+
+    OpenJPEG 缩小后的尺寸向上取整，Pillow 却按四舍五入分配图像，两者不一致时解码失败，因此跳过这样的层级。
+    """
+    best = 0
+    level = 1
+    while (size[0] >> level) >= target_size[0] and (size[1] >> level) >= target_size[1]:
+        power = 1 << level
+        if all((length + (power >> 1)) // power == -(-length // power) for length in size):
+            best = level
+        level += 1
+    return best
+
+
+def shrink_on_load(img, target_size):
+    """解码前请求解码器直接输出缩小的图像
+
+    对JPEG使用DCT缩放（Image.draft），按1/2、1/4、1/8中不小于目标尺寸的最小比例解码；
+    对JPEG2000按分辨率层级（reduce）解码，每级缩小1/2。可以成倍减少解码时间和内存占用。
+    其他格式不支持时不做任何处理。必须在图像数据被加载之前调用。
+    """
+    if target_size is None:
+        return img
+    if target_size[0] < img.size[0] and target_size[1] < img.size[1]:
+        if img.format == "JPEG2000":
+            level = jpeg2000_reduce_level(img.size, target_size)
+            if level:
+                img.reduce = level
+        else:
+            img.draft(img.mode, target_size)
+    return img
+
+
+@allow_large_images()
+def estimate_memory(input_file, output_format, resize_option, resize_width, resize_height):
+    """根据文件头估算转换该文件时的峰值内存（字节）
+
+    只读取文件头，不解码。按缩小解码后的尺寸计算解码图像，再加上透明通道处理和缩放产生的副本。
+    """
+    with Image.open(input_file) as img:
+        target_size = get_target_size(img.size, resize_option, resize_width, resize_height)
+        bands = len(img.getbands())
+        needs_flatten = img.mode in ('RGBA', 'LA') and output_format.lower() == 'jpeg'
+        if is_multi_frame(img, output_format):
+            # 逐帧转换时同时存在的是源图当前帧、合成用的上一帧和转换后的一帧（均按RGBA计算）
+            output_size = target_size or img.size
+            return img.size[0] * img.size[1] * 4 * 2 + output_size[0] * output_size[1] * 4
+        if supports_tiled_resize(img, target_size):
+            # 分段缩放时同时存在的只有当前段、待拼接的段和缩放结果
+            return strip_memory(img) * 2 + target_size[0] * target_size[1] * bands
+        # draft只修改解码参数，可以直接得到缩小解码后的尺寸
+        shrink_on_load(img, target_size)
+        decoded_size = img.size
+        if img.format == "JPEG2000" and target_size is not None:
+            level = jpeg2000_reduce_level(img.size, target_size)
+            # OpenJPEG 每级缩小时尺寸向上取整，按此计算不会低估实际解码的尺寸
+            decoded_size = (math.ceil(img.size[0] / 2 ** level), math.ceil(img.size[1] / 2 ** level))
+        decoded = decoded_size[0] * decoded_size[1] * bands
+
+    peak = decoded
+    if needs_flatten:
+        peak += decoded_size[0] * decoded_size[1] * 3
+    if target_size is not None:
+        peak += target_size[0] * target_size[1] * bands
+    return peak
+
+
+def resize_image(img, target_size):
+    """将图片缩放到目标尺寸"""
+    if target_size is None or img.size == tuple(target_size):
+        return img
+    return img.resize(target_size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def build_save_params(output_format, quality, encoder_preset=DEFAULT_ENCODER_PRESET):
+    """生成保存参数，encoder_preset 为 ENCODER_PRESETS 中的编码预设"""
+    if encoder_preset not in ENCODER_PRESETS:
+        raise ValueError(f"未知的编码预设: {encoder_preset}")
+    save_params = {}
+    if output_format.lower() == 'jpeg':
+        save_params = {'format': 'JPEG', 'quality': quality}
+    elif output_format.lower() == 'png':
+        # PNG格式不使用quality参数
+        save_params = {'format': 'PNG'}
+    elif output_format.lower() == 'webp':
+        save_params = {'format': 'WEBP', 'quality': quality}
+    elif output_format.lower() == 'bmp':
+        save_params = {'format': 'BMP'}
+    elif output_format.lower() == 'tiff':
+        save_params = {'format': 'TIFF'}
+    elif output_format.lower() == 'gif':
+        save_params = {'format': 'GIF'}
+    elif output_format.lower() == 'avif':
+        if not HEIF_SUPPORT:
+            raise Exception("AVIF格式需要安装pillow-heif库支持。请运行: pip install pillow-heif")
+        save_params = {'format': 'AVIF', 'quality': quality}
+    elif output_format.lower() == 'jpeg2000':
+        save_params = {'format': 'JPEG2000', 'quality': quality}
+    elif output_format.lower() == 'tga':
+        save_params = {'format': 'TGA'}
+    elif output_format.lower() == 'jxl':
+        if not JXL_SUPPORT:
+            raise Exception("JXL格式需要安装Pillow-JXL-Plugin库支持。请运行: pip install Pillow-JXL-Plugin")
+        save_params = {'format': 'JXL', 'quality': quality}
+    save_params.update(ENCODER_PRESETS[encoder_preset].get(output_format.upper(), {}))
+    return save_params
+
+
+def encode_image(img, output_format, quality, max_bytes=None, encoder_preset=DEFAULT_ENCODER_PRESET, **save_options):
+    """把图像编码到内存，返回 (编码结果BytesIO, 使用的质量, 编码次数)
+
+    指定 max_bytes 且输出格式支持时，在 [MIN_SEARCH_QUALITY, quality] 范围内二分查找不超过该大小的最高质量。
+    每次尝试都从同一个已解码、已缩放的图像编码到内存，不会重新解码，也不会写入文件；
+    最低质量仍然超出上限时返回最低质量的结果，由调用方决定如何处理。
+    """
+    def encode(q):
+        buffer = io.BytesIO()
+        img.save(buffer, **save_options, **build_save_params(output_format, q, encoder_preset))
+        return buffer
+
+    buffer = encode(quality)
+    if not max_bytes or output_format.upper() not in SIZE_LIMIT_FORMATS or buffer.getbuffer().nbytes <= max_bytes:
+        return buffer, quality, 1
+
+    # 输出大小随质量（大致）单调增加，二分查找满足上限的最高质量
+    trials = 1
+    best = None  # 满足上限的最高质量的结果
+    lowest = (buffer, quality)  # 尝试过的最低质量的结果
+    low, high = MIN_SEARCH_QUALITY, quality - 1
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = encode(mid)
+        trials += 1
+        if candidate.getbuffer().nbytes <= max_bytes:
+            best = (candidate, mid)
+            low = mid + 1
+        else:
+            if mid < lowest[1]:
+                lowest = (candidate, mid)
+            high = mid - 1
+    buffer, used_quality = best or lowest
+    return buffer, used_quality, trials
+
+
+class ConversionError(Exception):
+    """单个文件转换失败，记录失败的文件和所处的阶段"""
+
+    def __init__(self, input_file, stage, message):
+        # 参数全部传给基类，保证异常可以在进程之间传递（pickle）
+        super().__init__(input_file, stage, message)
+        self.input_file = input_file
+        self.stage = stage
+        self.message = message
+
+    def __str__(self):
+        return f"{self.input_file} [{self.stage}]: {self.message}"
+
+    def toDict(self):
+        return {"path": self.input_file, "stage": self.stage, "error": self.message}
+
+
+class StageTimer:
+    """记录转换各阶段耗时（秒）"""
+
+    def __init__(self):
+        self.timings = {}
+        self.stage = None
+        self._start = None
+
+    def start(self, stage):
+        """结束当前阶段并开始新的阶段"""
+        self.stop()
+        self.stage = stage
+        self._start = time.perf_counter()
+
+    def stop(self):
+        if self._start is not None:
+            elapsed = time.perf_counter() - self._start
+            self.timings[self.stage] = self.timings.get(self.stage, 0.0) + elapsed
+            self._start = None
+
+
+def can_pass_through(img, input_file, output_format, resize_option, resize_width, resize_height, max_bytes=None):
+    """输入文件可以原样作为输出：已经是目标格式、不需要改变尺寸、不超过文件大小上限
+
+    只根据文件头判断，必须在图像数据被加载之前调用（缩小解码会改变 img.size）。
+    """
+    if img.format != output_format.upper():
+        return False
+    target_size = get_target_size(img.size, resize_option, resize_width, resize_height)
+    if target_size is not None and tuple(target_size) != img.size:
+        return False
+    if max_bytes and os.path.getsize(input_file) > max_bytes:
+        return False
+    return True
+
+
+def is_multi_frame(img, output_format):
+    """输入是动画或多页图片，并且输出格式可以保存全部帧"""
+    return getattr(img, "n_frames", 1) > 1 and output_format.upper() in MULTI_FRAME_FORMATS
+
+
+class FrameSequence(Image.Image):
+    """逐帧转换多帧图片的"虚拟"图像
+
+    作为 save(save_all=True) 的图像交给编码器。编码器逐帧调用 seek() 时才解码并转换对应的一帧，
+    任何时候只保留当前一帧。各帧的显示时长在 seek() 时依次记录到 durations 中，
+    编码器在取得该帧之后才按帧序号读取，因此可以直接作为 duration 参数传入。
+    """
+
+    def __init__(self, source, convert_frame, timer=None):
+        super().__init__()
+        self._source = source
+        self._convert_frame = convert_frame  # 把源图当前帧转换为输出帧的函数
+        self._timer = timer
+        self._frame = None
+        self.n_frames = source.n_frames
+        self.is_animated = self.n_frames > 1
+        self.durations = []  # 各帧显示时长（毫秒）
+        self.seek(0)
+
+    def seek(self, frame):
+        if frame == self._frame:
+            return
+        if not 0 <= frame < self.n_frames:
+            raise EOFError("no more frames")
+
+        self._source.seek(frame)
+        converted = self._convert_frame(self._source)
+        if self._timer is not None:
+            self._timer.start("encode")
+
+        duration = self._source.info.get("duration", 0)
+        if len(self.durations) == frame:
+            self.durations.append(duration)
+        self.im = converted.im
+        self._size = converted.size
+        self._mode = converted.mode
+        if not isinstance(getattr(Image.Image, "mode", None), property):
+            self.mode = converted.mode  # Pillow 10.1 之前mode是普通属性
+        self.info = {"duration": duration}
+        self._frame = frame
+
+    def tell(self):
+        return self._frame
+
+
+def _convert_frame(frame, output_format, resize_option, resize_width, resize_height, timer):
+    """转换多帧图片中的当前帧，返回新的图像（源图在切换帧时会被修改）"""
+    timer.start("decode")
+    frame.load()
+    if frame.mode in ('P', 'PA'):
+        has_alpha = 'A' in frame.getbands() or 'transparency' in frame.info
+        img = frame.convert('RGBA' if has_alpha else 'RGB')
+    else:
+        img = frame.copy()
+
+    timer.start("flatten")
+    img = _replace_image(img, flatten_alpha(img, output_format))
+
+    timer.start("resize")
+    target_size = get_target_size(img.size, resize_option, resize_width, resize_height)
+    return _replace_image(img, resize_image(img, target_size))
+
+
+def _replace_image(old_img, new_img):
+    """用处理后的图像替换原图像，并立即释放原图像的像素数据
+
+    每一步处理都会生成新的图像，如果不释放，解码图像、透明通道处理结果和缩放结果会同时留在内存中。
+    """
+    if new_img is not old_img:
+        old_img.close()
+    return new_img
+
+
+def _encode_opened(img, input_file, output_format, quality, resize_option, resize_width, resize_height, max_bytes,
+                   encoder_preset, timer):
+    """解码、处理并编码已打开的图片，返回 (编码结果BytesIO, 使用的质量, 编码次数, 帧数)
+
+    input_file 为文件路径时超大TIFF可以分段解码，否则（如内存中的数据）整体解码。
+    """
+    target_size = get_target_size(img.size, resize_option, resize_width, resize_height)
+    save_options = {}
+    frame_count = 1
+
+    if is_multi_frame(img, output_format):
+        # 动画和多页图片在编码时逐帧解码和转换，保留每帧的显示时长和循环次数
+        save_options = {"save_all": True, "loop": img.info.get("loop", 0)}
+        img = FrameSequence(
+            img, lambda frame: _convert_frame(frame, output_format, resize_option, resize_width, resize_height, timer),
+            timer
+        )
+        frame_count = img.n_frames
+        save_options["duration"] = img.durations
+    elif isinstance(input_file, str) and supports_tiled_resize(img, target_size):
+        # 超大图片分段解码、处理透明通道和缩放
+        img = tiled_resize(
+            img, input_file, target_size, REDUCING_GAP,
+            prepare=lambda strip: flatten_alpha(strip, output_format), timer=timer
+        )
+    else:
+        # 缩小时按接近目标的尺寸解码
+        timer.start("decode")
+        img = shrink_on_load(img, target_size)
+        img.load()
+
+        timer.start("flatten")
+        img = _replace_image(img, flatten_alpha(img, output_format))
+
+        # 调整大小 - 使用更高效的算法
+        timer.start("resize")
+        img = _replace_image(img, resize_image(img, target_size))
+
+    timer.start("encode")
+    if save_options.get("save_all"):
+        buffer = io.BytesIO()
+        img.save(buffer, **save_options, **build_save_params(output_format, quality, encoder_preset))
+        used_quality, trials = quality, 1
+    else:
+        buffer, used_quality, trials = encode_image(img, output_format, quality, max_bytes, encoder_preset, **save_options)
+    img.close()
+    return buffer, used_quality, trials, frame_count
+
+
+@allow_large_images()
+def convert_file(input_file, output_dir, output_format, quality, resize_option, resize_width, resize_height, suffix="",
+                 max_bytes=None, pass_through="copy", encoder_preset=DEFAULT_ENCODER_PRESET, fsync=False):
+    """转换单个文件，返回转换结果
+
+    该函数为模块级函数，可以直接提交到进程池中执行。任何错误都会包装为ConversionError，
+    其中记录了失败的阶段（open/decode/flatten/resize/encode/write）。
+
+    max_bytes 为输出文件大小上限，指定时按 encode_image 在内存中查找满足上限的最高质量，
+    只写入最终结果；动画和多页图片每次尝试都要重新解码全部帧，因此不做查找，按 quality 输出。
+
+    pass_through 为 src.fileops.PASS_THROUGH_MODES 之一：输入已经是目标格式、不需要缩放时不解码，
+    直接复制（或硬链接）输入文件，结果中的 pass_through 记录实际使用的方式，耗时计入 copy 阶段。
+    encoder_preset 为 ENCODER_PRESETS 中的编码预设。
+    输出先写入临时文件再重命名（见 src.fileops.write_output），fsync 为 True 时写入后立即同步到磁盘。
+
+    返回的字典包含输入/输出文件路径、格式、输入/输出字节数、帧数，以及各阶段耗时（秒）；
+    指定 max_bytes 时还包含实际使用的质量（quality）和编码次数（quality_trials），
+    查找质量的时间计入 encode 阶段，最低质量仍超出上限时 over_size_limit 为 True。
+    """
+    output_file = get_output_path(input_file, output_dir, output_format, suffix)
+    timer = StageTimer()
+
+    try:
+        # 打开图片（此时只读取了文件头）
+        timer.start("open")
+        with Image.open(input_file) as img:
+            if pass_through != "off" and can_pass_through(
+                    img, input_file, output_format, resize_option, resize_width, resize_height, max_bytes):
+                timer.start("copy")
+                method = pass_through_file(input_file, output_file, pass_through, fsync)
+                timer.stop()
+                return {
+                    "input": input_file,
+                    "output": output_file,
+                    "format": output_format.upper(),
+                    "input_bytes": os.path.getsize(input_file),
+                    "output_bytes": os.path.getsize(output_file),
+                    "frames": getattr(img, "n_frames", 1),
+                    "timings": timer.timings,
+                    "pass_through": method,
+                }
+
+            # 先编码到内存，再一次性写入文件，分别统计编码和写入时间
+            buffer, used_quality, trials, frame_count = _encode_opened(
+                img, input_file, output_format, quality, resize_option, resize_width, resize_height,
+                max_bytes, encoder_preset, timer
+            )
+
+        timer.start("write")
+        write_output(output_file, buffer.getbuffer(), fsync)
+        timer.stop()
+    except Exception as e:
+        raise ConversionError(input_file, timer.stage, f"{type(e).__name__}: {e}") from None
+
+    result = {
+        "input": input_file,
+        "output": output_file,
+        "format": output_format.upper(),
+        "input_bytes": os.path.getsize(input_file),
+        "output_bytes": buffer.getbuffer().nbytes,
+        "frames": frame_count,
+        "timings": timer.timings,
+    }
+    if max_bytes:
+        _add_size_limit_result(result, used_quality, trials, max_bytes)
+    return result
+
+
+def _add_size_limit_result(result, quality, trials, max_bytes):
+    """在结果中记录按文件大小上限选择的质量和编码次数"""
+    result["quality"] = quality
+    result["quality_trials"] = trials
+    if result["output_bytes"] > max_bytes:
+        result["over_size_limit"] = True
+
+
+def convert_image_data(source, output_format, quality, resize_option, resize_width, resize_height, max_bytes=None,
+                       encoder_preset=DEFAULT_ENCODER_PRESET):
+    """转换一张图片，返回 (输出数据, 转换结果)，不写入文件
+
+    source 为文件路径或图片数据（bytes）。该函数为模块级函数，可以直接提交到进程池中执行；
+    错误包装为ConversionError。转换结果与 convert_file 的返回值相同，但没有输出路径。
+    数据可能来自不可信的客户端，因此不放宽像素数上限（不使用 allow_large_images），超出时按解压炸弹拒绝。
+    """
+    input_file = source if isinstance(source, str) else "<数据>"
+    timer = StageTimer()
+    try:
+        timer.start("open")
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+            buffer, used_quality, trials, frame_count = _encode_opened(
+                img, source if isinstance(source, str) else None, output_format, quality,
+                resize_option, resize_width, resize_height, max_bytes, encoder_preset, timer
+            )
+        timer.stop()
+    except Exception as e:
+        raise ConversionError(input_file, timer.stage, f"{type(e).__name__}: {e}") from None
+
+    result = {
+        "input": input_file,
+        "format": output_format.upper(),
+        "input_bytes": os.path.getsize(source) if isinstance(source, str) else len(source),
+        "output_bytes": buffer.getbuffer().nbytes,
+        "frames": frame_count,
+        "timings": timer.timings,
+    }
+    if max_bytes:
+        _add_size_limit_result(result, used_quality, trials, max_bytes)
+    return buffer.getvalue(), result
+
+
+# 多输出时，较小的输出从已生成的较大输出继续缩小的条件：较大输出的宽高都不小于目标的该倍数
+REUSE_MIN_RATIO = 2.0
+
+
+def _rendition(result):
+    """多输出结果中单个输出的部分"""
+    keys = ("output", "format", "output_bytes", "timings", "quality", "quality_trials", "over_size_limit", "pass_through")
+    return {key: result[key] for key in keys if key in result}
+
+
+@allow_large_images()
+def convert_file_targets(input_file, output_dir, targets, pass_through="copy", fsync=False):
+    """一次解码生成多个输出（targets 为 normalize_output_targets 整理后的输出目标列表）
+
+    所有输出共用一次解码：按各输出中最大的尺寸缩小解码，再从大到小依次生成各输出，
+    较小的输出尽量从已生成的较大输出继续缩小。动画和多页图片无法共用解码结果，逐个输出分别转换。
+    与输入格式相同且不需要缩放的输出按 pass_through 直接复制，不参与解码；全部输出都可以复制时完全不解码。
+
+    返回的字典与 convert_file 相同，但 output/format 为列表，字节数和各阶段耗时为所有输出之和，
+    renditions 中是每个输出各自的路径、格式、字节数和耗时（设置了文件大小上限的输出还包含质量和编码次数）。
+    """
+    timer = StageTimer()
+    active_timer = timer  # 出错时从中取得失败的阶段
+    current_format = None
+    renditions = [None] * len(targets)
+    frame_count = 1
+
+    try:
+        timer.start("open")
+        with Image.open(input_file) as img:
+            copied = []  # 直接复制的输出
+            if pass_through != "off":
+                copied = [
+                    index for index, t in enumerate(targets)
+                    if can_pass_through(img, input_file, t["output_format"], t["resize_option"], t["resize_width"],
+                                        t["resize_height"], t.get("max_bytes"))
+                ]
+            encoded = [index for index in range(len(targets)) if index not in copied]
+            multi_frame = any(is_multi_frame(img, targets[index]["output_format"]) for index in encoded)
+
+            for index in copied:
+                current_format = targets[index]["output_format"]
+                output_file = get_output_path(input_file, output_dir, current_format, targets[index]["suffix"])
+                active_timer = StageTimer()
+                active_timer.start("copy")
+                method = pass_through_file(input_file, output_file, pass_through, fsync)
+                active_timer.stop()
+                renditions[index] = {
+                    "output": output_file,
+                    "format": current_format,
+                    "output_bytes": os.path.getsize(output_file),
+                    "timings": active_timer.timings,
+                    "pass_through": method,
+                }
+                frame_count = max(frame_count, getattr(img, "n_frames", 1))
+            current_format = None
+
+            if encoded and not multi_frame:
+                sizes = [
+                    get_target_size(img.size, t["resize_option"], t["resize_width"], t["resize_height"]) for t in targets
+                ]
+
+                # 按能容纳所有输出的尺寸解码；有不缩放的输出时必须完整解码
+                bounding = None
+                if all(sizes[index] is not None for index in encoded):
+                    bounding = (max(sizes[index][0] for index in encoded), max(sizes[index][1] for index in encoded))
+                if bounding is not None and supports_tiled_resize(img, bounding):
+                    scale = max(bounding[0] / img.size[0], bounding[1] / img.size[1])
+                    source_size = (min(img.size[0], math.ceil(img.size[0] * scale)), min(img.size[1], math.ceil(img.size[1] * scale)))
+                    source = tiled_resize(img, input_file, source_size, REDUCING_GAP, timer=timer)
+                else:
+                    timer.start("decode")
+                    source = shrink_on_load(img, bounding)
+                    source.load()
+
+                # 从大到小生成，已生成的较大输出可以作为较小输出的缩放来源
+                candidates = [source]
+                order = sorted(encoded, key=lambda i: -(sizes[i][0] * sizes[i][1] if sizes[i] else float("inf")))
+                for index in order:
+                    target = targets[index]
+                    target_size = sizes[index]
+                    current_format = target["output_format"]
+                    output_file = get_output_path(input_file, output_dir, current_format, target["suffix"])
+                    active_timer = StageTimer()
+
+                    active_timer.start("resize")
+                    base = source
+                    if target_size is not None:
+                        for candidate in candidates:
+                            if (candidate.size[0] >= target_size[0] * REUSE_MIN_RATIO
+                                    and candidate.size[1] >= target_size[1] * REUSE_MIN_RATIO
+                                    and candidate.size[0] * candidate.size[1] < base.size[0] * base.size[1]):
+                                base = candidate
+                    resized = resize_image(base, target_size)
+                    if resized is not base:
+                        candidates.append(resized)
+
+                    active_timer.start("flatten")
+                    output_img = flatten_alpha(resized, current_format)
+
+                    active_timer.start("encode")
+                    max_bytes = target.get("max_bytes")
+                    try:
+                        buffer, used_quality, trials = encode_image(
+                            output_img, current_format, target["quality"], max_bytes, target["encoder_preset"]
+                        )
+                    finally:
+                        # 透明通道处理的结果只用于这一个输出，缩放结果还要留作较小输出的来源
+                        if output_img is not resized:
+                            output_img.close()
+
+                    active_timer.start("write")
+                    write_output(output_file, buffer.getbuffer(), fsync)
+                    active_timer.stop()
+
+                    renditions[index] = {
+                        "output": output_file,
+                        "format": current_format,
+                        "output_bytes": buffer.getbuffer().nbytes,
+                        "timings": active_timer.timings,
+                    }
+                    if max_bytes:
+                        _add_size_limit_result(renditions[index], used_quality, trials, max_bytes)
+
+                for candidate in candidates:
+                    candidate.close()
+        timer.stop()
+    except Exception as e:
+        stage = active_timer.stage
+        message = f"{type(e).__name__}: {e}"
+        if current_format is not None:
+            message = f"[{current_format}] {message}"
+        raise ConversionError(input_file, stage, message) from None
+
+    if multi_frame:
+        for index in encoded:
+            target = targets[index]
+            result = convert_file(
+                input_file, output_dir, target["output_format"], target["quality"],
+                target["resize_option"], target["resize_width"], target["resize_height"], target["suffix"],
+                target.get("max_bytes"), pass_through, target["encoder_preset"], fsync
+            )
+            frame_count = max(frame_count, result["frames"])
+            renditions[index] = _rendition(result)
+
+    timings = dict(timer.timings)
+    for rendition in renditions:
+        for stage, elapsed in rendition["timings"].items():
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+    return {
+        "input": input_file,
+        "output": [rendition["output"] for rendition in renditions],
+        "format": [rendition["format"] for rendition in renditions],
+        "input_bytes": os.path.getsize(input_file),
+        "output_bytes": sum(rendition["output_bytes"] for rendition in renditions),
+        "frames": frame_count,
+        "timings": timings,
+        "renditions": renditions,
+    }
+
+
+@allow_large_images()
+def render_preview(input_file, output_format, resize_option, resize_width, resize_height, max_size):
+    """按显示区域的分辨率渲染预览图
+
+    返回(预览图, 转换后的实际尺寸)。预览图与转换结果的宽高比一致，但不超过max_size，
+    并尽量使用缩小解码，避免完整解码大图。
+    """
+    with Image.open(input_file) as original:
+        target_size = get_target_size(original.size, resize_option, resize_width, resize_height)
+        output_size = target_size or original.size
+
+        # 将转换后的尺寸等比缩小到不超过显示区域
+        scale = min(1.0, max_size[0] / float(output_size[0]), max_size[1] / float(output_size[1]))
+        preview_size = (max(1, int(round(output_size[0] * scale))), max(1, int(round(output_size[1] * scale))))
+
+        if supports_tiled_resize(original, preview_size):
+            img = tiled_resize(original, input_file, preview_size, REDUCING_GAP,
+                               prepare=lambda strip: flatten_alpha(strip, output_format))
+        else:
+            img = shrink_on_load(original, preview_size)
+            img.load()
+            img = flatten_alpha(img, output_format)
+            img = resize_image(img, preview_size)
+
+        if img.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        elif img is original:
+            # 关闭文件后原图数据会被释放，需要保留一份副本
+            img = img.copy()
+
+    return img, output_size
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""输入文件去重
+
+同一个文件夹被拖入两次，或者相机备份中有大量完全相同的照片时，同样的内容会被反复解码和编码。
+转换前先找出内容完全相同的输入：同一路径直接视为重复；大小相同的文件才需要计算内容哈希，
+哈希在线程池中并行计算。每组相同的内容只转换第一个文件，其余文件的输出直接复制（或硬链接）。
+本模块不依赖PyQt5。
+"""
+
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 可选的非加密哈希（更快），未安装时使用标准库的BLAKE2
+try:
+    import xxhash
+    XXHASH_SUPPORT = True
+except ImportError:
+    XXHASH_SUPPORT = False
+
+# 每次读取的字节数
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# 重复输入的输出处理方式："copy" 复制（支持时使用reflink），"hardlink" 硬链接，"off" 不去重
+DEDUP_MODES = ("off", "copy", "hardlink")
+
+
+def content_hash(file_path):
+    """文件内容的哈希值（十六进制字符串）"""
+    hasher = xxhash.xxh3_128() if XXHASH_SUPPORT else hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None  # 无法访问的文件不参与去重，交给转换过程报告错误
+
+
+def _try_hash(file_path):
+    try:
+        return content_hash(file_path)
+    except OSError:
+        return None
+
+
+def find_duplicates(input_files, max_workers=None, should_stop=None):
+    """找出内容与之前某个输入完全相同的输入文件
+
+    返回 {重复的文件: 第一次出现的相同内容的文件}，不在其中的文件都需要转换。
+    should_stop 为可选的无参函数，返回True时停止查找（已找到的结果仍然有效）。
+    """
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+    duplicates = {}
+    originals = {}  # 规范化路径 -> 第一次出现的文件
+    unique_files = []
+    for input_file in input_files:
+        key = os.path.normcase(os.path.abspath(input_file))
+        if key in originals:
+            duplicates[input_file] = originals[key]
+        else:
+            originals[key] = input_file
+            unique_files.append(input_file)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 先按大小筛选，只有大小相同的文件才可能内容相同
+        sizes = dict(zip(unique_files, executor.map(_file_size, unique_files)))
+        size_counts = {}
+        for size in sizes.values():
+            size_counts[size] = size_counts.get(size, 0) + 1
+        # 保持输入顺序，使每组中第一个出现的文件作为原件
+        candidates = [f for f in unique_files if sizes[f] is not None and size_counts[sizes[f]] > 1]
+
+        first_by_hash = {}
+        batch_size = max_workers * 4
+        for start in range(0, len(candidates), batch_size):
+            if should_stop is not None and should_stop():
+                break
+            batch = candidates[start:start + batch_size]
+            for input_file, digest in zip(batch, executor.map(_try_hash, batch)):
+                if digest is None:
+                    continue
+                key = (sizes[input_file], digest)
+                if key in first_by_hash:
+                    duplicates[input_file] = first_by_hash[key]
+                else:
+                    first_by_hash[key] = input_file
+    return duplicates
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""批量转换引擎
+
+负责把一批文件分发到进程池中并行转换，并处理增量跳过、失败隔离、工作进程崩溃恢复、
+批次日志和耗时日志。本模块不依赖PyQt5，GUI的转换线程和命令行工具共用这一套逻辑。
+"""
+
+import os
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from src.converter import (
+    DEFAULT_ENCODER_PRESET, ConversionError, StageTimer, convert_file, convert_file_targets, conversion_params,
+    default_worker_count, estimate_memory, get_output_path, normalize_output_targets
+)
+from src.dedup import find_duplicates
+from src.fileops import DEFAULT_SYNC_EVERY, pass_through_file, sync_files
+from src.journal import BatchJournal
+from src.manifest import ConversionManifest, file_signature
+from src.prefetch import DEFAULT_PREFETCH_BYTES, Prefetcher
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def start_worker_pool(max_workers=None):
+    """创建进程池并等待全部工作进程启动
+
+    工作进程启动时导入转换模块（Pillow等）需要一段时间；长期运行的服务先启动好进程池，
+    第一个任务就不必等待。
+    """
+    max_workers = max_workers or default_worker_count()
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    for future in [executor.submit(_worker_ready) for _ in range(max_workers)]:
+        future.result()
+    return executor
+
+
+class BatchConverter:
+    """批量转换一组文件
+
+    iterResults() 每处理完一个文件产生一条结果（字典），其中 status 为：
+    - "converted"：转换成功，包含输出路径、字节数和各阶段耗时（多输出时输出路径和格式为列表）；
+      由内容相同的文件的输出复制得到时还包含 deduplicated_from（原件）和 saved_seconds（节省的转换时间）
+    - "skipped"：无需转换（增量转换或不覆盖已有文件）
+    - "failed"：转换失败，包含失败阶段（stage）和错误信息（error）
+    """
+    MAX_WORKER_CRASHES = 2  # 同一文件单独转换时导致工作进程崩溃的次数达到该值时视为失败
+
+    def __init__(self, input_files, output_dir, output_format, quality, resize_option, resize_width, resize_height, max_workers=None,
+                 overwrite_files=True, incremental=False, continue_on_error=True, resume=False, timing_log=None,
+                 executor=None, journal=True, memory_budget=None, output_targets=None, max_bytes=None,
+                 pass_through="copy", encoder_preset=DEFAULT_ENCODER_PRESET, deduplicate="off", prefetch=0,
+                 prefetch_bytes=DEFAULT_PREFETCH_BYTES, durability="none", sync_every=DEFAULT_SYNC_EVERY,
+                 manifest=None):
+        self.input_files = input_files
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.quality = quality
+        self.resize_option = resize_option
+        self.resize_width = resize_width
+        self.resize_height = resize_height
+        self.max_bytes = max_bytes  # 输出文件大小上限（字节），超出时自动降低质量，None表示不限制
+        # 输入已经是目标格式且不需要缩放时的处理方式（src.fileops.PASS_THROUGH_MODES），"off"表示总是重新编码
+        self.pass_through = pass_through
+        self.encoder_preset = encoder_preset  # 编码预设（src.converter.ENCODER_PRESETS），在编码速度和输出大小之间取舍
+        # 内容相同的输入只转换一次，其余的输出 "copy" 复制或 "hardlink" 硬链接，"off" 表示不去重
+        self.deduplicate = deduplicate
+        self.max_workers = max_workers or default_worker_count()  # 并行进程数，默认为CPU核心数
+        self.overwrite_files = overwrite_files  # 是否覆盖不是由本程序为该输入生成的同名文件
+        self.incremental = incremental  # 是否跳过输入和参数都未变化的文件
+        self.continue_on_error = continue_on_error  # 单个文件失败时是否继续转换其余文件
+        self.resume = resume  # 是否是在继续输出目录中未完成的批次
+        self.timing_log = timing_log  # 各阶段耗时日志文件（JSON Lines），None表示不记录
+        self.executor = executor  # 外部提供的执行器（如线程池），None表示自行创建进程池
+        self.journal = journal  # 是否写入批次日志（用于中断后继续）
+        # 外部提供的转换清单（如监视文件夹时在多个批次间共用），由调用方保存；None表示读取并保存输出目录中的清单
+        self.manifest = manifest
+        self.memory_budget = memory_budget  # 同时转换的文件预计占用内存的上限（字节），None表示不限制
+        # 预读：提前读取之后的多少个需要转换的文件（0表示不预读），已预读的文件总大小不超过 prefetch_bytes
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
+        # 输出写入磁盘的方式（src.fileops.DURABILITY_MODES）："batch" 时每完成 sync_every 个文件同步一次
+        self.durability = durability
+        self.sync_every = sync_every
+        # 多输出模式：每个输入文件解码一次，生成全部输出目标；None表示只按上面的单一格式和尺寸输出
+        self.output_targets = normalize_output_targets(output_targets, quality, encoder_preset) if output_targets else None
+        self.is_running = True
+        self.completed = False  # 批次是否已全部处理（没有被中途停止）
+        self.skipped_files = 0  # 跳过的文件数
+        self.duplicate_files = 0  # 由内容相同的文件的输出复制得到的文件数
+        self.saved_seconds = 0.0  # 去重节省的转换时间（秒，按原件的各阶段耗时计算）
+        self.failures = []  # 失败的文件 [{"path", "stage", "error"}, ...]
+        self.prefetched_bytes = 0  # 预读的字节数
+        self._journal = None  # 批次日志
+
+    def batchParams(self):
+        """批次参数，写入批次日志，继续批次时按原参数转换"""
+        return {
+            "output_format": self.output_format,
+            "quality": self.quality,
+            "resize_option": self.resize_option,
+            "resize_width": self.resize_width,
+            "resize_height": self.resize_height,
+            "max_bytes": self.max_bytes,
+            "pass_through": self.pass_through,
+            "encoder_preset": self.encoder_preset,
+            "deduplicate": self.deduplicate,
+            "overwrite_files": self.overwrite_files,
+            "incremental": self.incremental,
+            "continue_on_error": self.continue_on_error,
+            "output_targets": self.output_targets,
+        }
+
+    def stop(self):
+        """请求停止：不再提交新任务，正在执行的任务完成后结束"""
+        self.is_running = False
+
+    def _outputPath(self, input_file):
+        """输入文件对应的输出路径，多输出模式下为路径列表"""
+        if self.output_targets:
+            return [get_output_path(input_file, self.output_dir, t["output_format"], t["suffix"]) for t in self.output_targets]
+        return get_output_path(input_file, self.output_dir, self.output_format)
+
+    def _shouldSkip(self, manifest, input_file, output_file, params, signature):
+        """判断文件是否可以跳过"""
+        if self.incremental and signature is not None and manifest.isUpToDate(input_file, output_file, params, signature):
+            return True
+        # 不覆盖其他来源的同名文件
+        output_files = output_file if isinstance(output_file, list) else [output_file]
+        if (not self.overwrite_files and any(os.path.exists(path) for path in output_files)
+                and not manifest.isOwnOutput(input_file, output_file)):
+            return True
+        return False
+
+    def _outputFormat(self):
+        """输出格式，多输出模式下为格式列表"""
+        if self.output_targets:
+            return [t["output_format"] for t in self.output_targets]
+        return self.output_format.upper()
+
+    def _duplicateResult(self, input_file, output_file, original, outcome):
+        """用原件的输出生成内容相同的输入的输出，返回该文件的结果
+
+        outcome 为原件的转换结果；原件转换失败时为其ConversionError，此时该文件以同样的原因失败。
+        """
+        if isinstance(outcome, ConversionError):
+            return self._recordFailure(ConversionError(input_file, outcome.stage, outcome.message))
+
+        timer = StageTimer()
+        timer.start("copy")
+        sources = outcome["output"] if isinstance(outcome["output"], list) else [outcome["output"]]
+        targets = output_file if isinstance(output_file, list) else [output_file]
+        try:
+            for source, target in zip(sources, targets):
+                pass_through_file(source, target, self.deduplicate, self.durability == "file")
+            output_bytes = sum(os.path.getsize(target) for target in targets)
+            input_bytes = os.path.getsize(input_file)
+        except OSError as e:
+            return self._recordFailure(ConversionError(input_file, "copy", f"{type(e).__name__}: {e}"))
+        timer.stop()
+
+        saved_seconds = sum(outcome["timings"].values())
+        self.duplicate_files += 1
+        self.saved_seconds += saved_seconds
+        return {
+            "status": "converted",
+            "input": input_file,
+            "output": output_file,
+            "format": self._outputFormat(),
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "timings": timer.timings,
+            "deduplicated_from": original,
+            "saved_seconds": saved_seconds,
+        }
+
+    def _estimateMemory(self, input_file):
+        """预计转换该文件需要的内存，未设置内存上限时不读取文件头"""
+        if not self.memory_budget:
+            return 0
+        try:
+            if self.output_targets:
+                return max(
+                    estimate_memory(input_file, t["output_format"], t["resize_option"], t["resize_width"], t["resize_height"])
+                    for t in self.output_targets
+                )
+            return estimate_memory(input_file, self.output_format, self.resize_option, self.resize_width, self.resize_height)
+        except Exception:
+            return 0  # 无法读取文件头，交给转换过程报告错误
+
+    def _recordDone(self, input_file):
+        if self._journal is not None:
+            self._journal.recordDone(input_file)
+
+    def _recordFailure(self, error):
+        """记录失败的文件；未开启出错继续时直接中止整个批次"""
+        if self._journal is not None:
+            self._journal.recordFailed(error.toDict())
+        if not self.continue_on_error:
+            raise error
+        self.failures.append(error.toDict())
+        return {"status": "failed", "input": error.input_file, "stage": error.stage, "error": error.message}
+
+    def iterResults(self):
+        """执行转换，逐个产生每个文件的结果"""
+        manifest = None
+        timing_log_file = None
+        prefetcher = None
+        self.completed = False
+        try:
+            total_files = len(self.input_files)
+
+            # 检查输出目录是否存在，不存在则创建
+            os.makedirs(self.output_dir, exist_ok=True)
+
+            manifest = self.manifest if self.manifest is not None else ConversionManifest(self.output_dir)
+            if self.journal:
+                self._journal = BatchJournal(self.output_dir, self.input_files, self.batchParams(), resume=self.resume)
+            if self.timing_log:
+                timing_log_file = open(self.timing_log, "a", encoding="utf-8")
+            if self.output_targets:
+                params = self.output_targets
+            else:
+                params = conversion_params(
+                    self.output_format, self.quality, self.resize_option, self.resize_width, self.resize_height, self.max_bytes,
+                    self.encoder_preset
+                )
+
+            # 少量文件时不必启动多余的进程
+            workers = max(1, min(self.max_workers, total_files))
+            # 限制同时提交的任务数，便于及时响应停止请求
+            max_pending = workers * 2
+
+            owns_executor = self.executor is None
+            executor = ProcessPoolExecutor(max_workers=workers) if owns_executor else self.executor
+            pending = {}  # future -> (输入文件, 输出文件, 提交时的文件签名, 预计内存)
+            crash_counts = {}  # 输入文件 -> 单独转换时工作进程崩溃的次数
+            retry_queue = []  # 进程池崩溃时正在转换、需要逐个单独重新提交的任务
+            isolated = None  # 正在单独转换的重试任务的future
+            waiting = None  # 因超出内存上限而等待提交的任务
+            planned = deque()  # 已确定需要转换、尚未提交的任务；预读时提前确定之后的若干个文件
+            if self.prefetch:
+                prefetcher = Prefetcher(self.prefetch_bytes)
+            memory_in_use = 0  # 已提交任务的预计内存之和
+            file_iter = iter(self.input_files)
+            exhausted = False  # 是否已没有待提交的输入文件
+
+            # 找出内容相同的输入：每组只转换第一个文件（原件），其余文件等原件完成后复制其输出
+            duplicates = {}  # 重复的输入 -> 原件
+            if self.deduplicate != "off":
+                duplicates = find_duplicates(self.input_files, should_stop=lambda: not self.is_running)
+            originals = set(duplicates.values())
+            outcomes = {}  # 原件 -> 转换结果（失败时为ConversionError）
+            duplicate_waiters = {}  # 正在转换的原件 -> [(重复的输入, 输出文件, 文件签名), ...]
+
+            unsynced = []  # 批量同步模式下已完成、尚未同步到磁盘的文件的结果
+
+            def finish(result, signature):
+                """记录成功转换（或复制）的文件"""
+                if signature is not None:
+                    manifest.record(result["input"], result["output"], params, signature)
+                if self.durability == "batch":
+                    # 同步之后才在批次日志中记为完成，掉电后继续批次时会重新转换未同步的文件
+                    unsynced.append(result)
+                    if len(unsynced) >= self.sync_every:
+                        sync_outputs()
+                else:
+                    self._recordDone(result["input"])
+                if timing_log_file is not None:
+                    timing_log_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+            def sync_outputs():
+                """把尚未同步的输出文件写入磁盘"""
+                if not unsynced:
+                    return
+                paths = []
+                for result in unsynced:
+                    paths.extend(result["output"] if isinstance(result["output"], list) else [result["output"]])
+                try:
+                    sync_files(paths)
+                except OSError as e:
+                    print(f"同步输出文件失败: {e}")
+                else:
+                    for result in unsynced:
+                        self._recordDone(result["input"])
+                unsynced.clear()
+
+            def resolve_duplicates(original, outcome):
+                """原件完成后处理等待它的重复输入"""
+                if original not in originals:
+                    return
+                outcomes[original] = outcome
+                for input_file, output_file, signature in duplicate_waiters.pop(original, []):
+                    result = self._duplicateResult(input_file, output_file, original, outcome)
+                    if result["status"] == "converted":
+                        finish(result, signature)
+                    yield result
+
+            def plan():
+                """确定之后需要转换的文件，放入 planned；跳过的文件和内容重复的文件在这里产生结果"""
+                while len(planned) < max(1, self.prefetch):
+                    input_file = next(file_iter, None)
+                    if input_file is None:
+                        return
+
+                    output_file = self._outputPath(input_file)
+                    try:
+                        signature = file_signature(input_file)
+                    except OSError:
+                        signature = None  # 文件无法访问，交给转换过程报告错误
+
+                    if self._shouldSkip(manifest, input_file, output_file, params, signature):
+                        # 原件的输出仍然有效时，可以直接复制给内容相同的输入
+                        if input_file in originals and manifest.isUpToDate(input_file, output_file, params, signature):
+                            outcomes[input_file] = {"output": output_file, "timings": {}}
+                        self._recordDone(input_file)
+                        self.skipped_files += 1
+                        yield {"status": "skipped", "input": input_file, "output": output_file}
+                        continue
+
+                    original = duplicates.get(input_file)
+                    if original in outcomes:
+                        result = self._duplicateResult(input_file, output_file, original, outcomes[original])
+                        if result["status"] == "converted":
+                            finish(result, signature)
+                        yield result
+                        continue
+                    if original in duplicate_waiters:
+                        duplicate_waiters[original].append((input_file, output_file, signature))
+                        continue
+                    # 原件被跳过且输出不可用（如不覆盖其他来源的同名文件）时，按普通文件转换
+
+                    if input_file in originals:
+                        duplicate_waiters[input_file] = []
+                    planned.append((input_file, output_file, signature))
+                    if prefetcher is not None:
+                        prefetcher.add(input_file)
+
+            def submit(input_file, output_file, signature, memory):
+                nonlocal memory_in_use
+                if self.output_targets:
+                    future = executor.submit(
+                        convert_file_targets, input_file, self.output_dir, self.output_targets, self.pass_through,
+                        self.durability == "file"
+                    )
+                else:
+                    future = executor.submit(
+                        convert_file, input_file, self.output_dir, self.output_format, self.quality,
+                        self.resize_option, self.resize_width, self.resize_height,
+                        max_bytes=self.max_bytes, pass_through=self.pass_through, encoder_preset=self.encoder_preset,
+                        fsync=self.durability == "file"
+                    )
+                pending[future] = (input_file, output_file, signature, memory)
+                memory_in_use += memory
+                return future
+
+            try:
+                while True:
+                    # 补充任务直到达到提交上限或内存上限
+                    while self.is_running and len(pending) < max_pending and isolated is None:
+                        if waiting is not None:
+                            task, waiting = waiting, None
+                        elif retry_queue:
+                            # 进程池崩溃时无法确定是哪个文件导致的，等其他任务完成后逐个单独重新转换，
+                            # 正常的文件不会再与导致崩溃的文件一起失败
+                            if not pending:
+                                isolated = submit(*retry_queue.pop())
+                            break
+                        else:
+                            yield from plan()
+                            if not planned:
+                                exhausted = True
+                                break
+                            input_file, output_file, signature = planned.popleft()
+                            task = (input_file, output_file, signature, self._estimateMemory(input_file))
+
+                        # 超出内存上限时等待已提交的任务完成；没有其他任务时总是提交，单个超大文件也能转换
+                        if self.memory_budget and pending and memory_in_use + task[3] > self.memory_budget:
+                            waiting = task
+                            break
+                        submit(*task)
+
+                    if pending:
+                        pool_broken = False
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            input_file, output_file, signature, memory = pending.pop(future)
+                            memory_in_use -= memory
+                            ran_alone = future is isolated
+                            if ran_alone:
+                                isolated = None
+                            if prefetcher is not None:
+                                prefetcher.release(input_file)
+                            try:
+                                result = future.result()
+                            except BrokenProcessPool:
+                                # 工作进程异常退出（例如解码器崩溃）时，同时在转换的任务都会失败；
+                                # 只有单独转换时的崩溃才计入该文件，多次崩溃的文件才记为失败
+                                pool_broken = True
+                                if ran_alone:
+                                    crash_counts[input_file] = crash_counts.get(input_file, 0) + 1
+                                if owns_executor and crash_counts.get(input_file, 0) < self.MAX_WORKER_CRASHES:
+                                    retry_queue.append((input_file, output_file, signature, memory))
+                                    continue
+                                error = ConversionError(input_file, "worker", "转换进程异常退出")
+                                yield self._recordFailure(error)
+                                yield from resolve_duplicates(input_file, error)
+                            except ConversionError as e:
+                                yield self._recordFailure(e)
+                                yield from resolve_duplicates(input_file, e)
+                            else:
+                                finish(result, signature)
+                                result["status"] = "converted"
+                                yield result
+                                yield from resolve_duplicates(input_file, result)
+
+                        if pool_broken and owns_executor:
+                            # 进程池已不可用，剩余任务都会失败，换一个新的进程池重新提交
+                            retry_queue.extend(pending.values())
+                            pending.clear()
+                            memory_in_use = 0
+                            executor.shutdown(wait=False)
+                            executor = ProcessPoolExecutor(max_workers=workers)
+
+                    if not self.is_running:
+                        # 取消尚未开始的任务，等待正在执行的任务结束
+                        for future in pending:
+                            future.cancel()
+                        break
+
+                    # 已提交的任务可能在同一次等待中全部完成，此时仍要继续提交剩余的文件
+                    if exhausted and not pending and not retry_queue and waiting is None:
+                        break
+            finally:
+                if owns_executor:
+                    executor.shutdown(wait=True)
+                else:
+                    # 外部执行器由调用方管理，只取消本批次尚未开始的任务
+                    for future in pending:
+                        future.cancel()
+                sync_outputs()
+
+            # 没有被中途停止时，批次视为已完成
+            self.completed = self.is_running
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+                self.prefetched_bytes = prefetcher.prefetched_bytes
+
+            if timing_log_file is not None:
+                timing_log_file.close()
+
+            # 批次完成时删除日志，否则保留以便之后继续
+            if self._journal is not None:
+                try:
+                    if self.completed:
+                        self._journal.finish()
+                    else:
+                        self._journal.close()
+                except OSError as e:
+                    print(f"关闭批次日志失败: {e}")
+
+            # 无论成功与否都保存已完成文件的记录
+            if manifest is not None and self.manifest is None:
+                try:
+                    manifest.save()
+                except OSError as e:
+                    print(f"保存转换清单失败: {e}")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""输出文件的写入、复制与链接
+
+输入文件已经是目标格式、不需要缩放时，转换结果与输入完全相同，直接复制文件即可，
+不必解码再编码（既浪费CPU，有损格式还会再损失一次画质）。
+编码结果和复制的文件都先写入临时文件再重命名，输出路径上不会出现不完整的文件。
+"""
+
+import os
+import shutil
+
+# 直接复制的方式：
+# - "copy"：支持写时复制的文件系统（Btrfs、XFS等）上创建共享数据块的副本（reflink），否则普通复制
+# - "hardlink"：创建硬链接，不占用额外空间；不在同一分区时退回复制
+# - "off"：不直接复制，总是重新编码
+PASS_THROUGH_MODES = ("copy", "hardlink", "off")
+
+# 输出文件写入磁盘的方式（输出总是先写入临时文件再重命名，转换中断不会留下不完整的文件）：
+# - "none"：由操作系统决定何时写入磁盘，最快；断电时最近写入的文件可能丢失
+# - "batch"：每转换 sync_every 个文件同步一次，断电时最多丢失最近的一批
+# - "file"：每个文件写入后立即同步，最安全，但在机械硬盘上明显变慢
+DURABILITY_MODES = ("none", "batch", "file")
+DEFAULT_SYNC_EVERY = 64
+
+# Linux 的 FICLONE ioctl（与 cp --reflink 相同）
+FICLONE = 0x40049409
+
+
+def reflink_file(src, dst):
+    """创建写时复制的副本，文件系统或平台不支持时抛出OSError"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前平台不支持reflink") from None
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+
+
+def temp_path(path):
+    """与 path 同一目录下的临时文件路径（以"."开头，扫描和监视目录时会被忽略）"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+
+
+def sync_directory(directory):
+    """把目录项（新建、重命名的文件）写入磁盘；Windows 不能打开目录，不需要也无法同步"""
+    if os.name != "posix":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_files(paths):
+    """把已写入的文件及其所在目录写入磁盘（批量同步时使用）"""
+    flags = os.O_RDONLY if os.name == "posix" else os.O_RDWR  # Windows 只能同步以写方式打开的文件
+    directories = set()
+    for path in paths:
+        try:
+            fd = os.open(path, flags)
+        except FileNotFoundError:
+            continue  # 已被删除或替换
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        directories.add(os.path.dirname(path))
+    for directory in directories:
+        sync_directory(directory)
+
+
+def _replace(tmp, dst, fsync):
+    """把临时文件原子地重命名为 dst，失败时删除临时文件"""
+    try:
+        if fsync:
+            sync_files([tmp])
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        sync_directory(os.path.dirname(dst))
+
+
+def write_output(path, data, fsync=False):
+    """把编码好的数据写入输出文件
+
+    先一次写入同一目录下的临时文件，再原子地重命名为 path：转换中断时输出路径上要么是旧文件，
+    要么是完整的新文件，不会出现只写了一半的图片。重命名替换的是目录项，输出路径原来是输入文件的硬链接时也不会改写输入文件。
+    fsync 为 True 时在重命名前后把文件和目录写入磁盘，断电后也不会丢失。
+    """
+    tmp = temp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)  # 超过缓冲区大小的数据不经过缓冲区，直接一次顺序写入
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    _replace(tmp, path, fsync)
+
+
+def pass_through_file(src, dst, mode="copy", fsync=False):
+    """把输入文件原样放到输出路径，返回实际使用的方式（"same"/"reflink"/"hardlink"/"copy"）
+
+    与 write_output 相同，先在临时文件上完成链接或复制，再原子地重命名为 dst。
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return "same"  # 输出就是输入本身（或已经是它的硬链接）
+
+    tmp = temp_path(dst)
+    if os.path.lexists(tmp):
+        os.remove(tmp)  # 上次中断时残留的临时文件
+    method = None
+    if mode == "hardlink":
+        try:
+            os.link(src, tmp)
+            method = "hardlink"
+        except OSError:
+            pass  # 不在同一分区或文件系统不支持硬链接
+
+    if method is None:
+        try:
+            reflink_file(src, tmp)
+            method = "reflink"
+        except OSError:
+            try:
+                shutil.copyfile(src, tmp)
+            except BaseException:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
+            method = "copy"
+    _replace(tmp, dst, fsync)
+    return method
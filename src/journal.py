@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""批次日志（用于崩溃后继续转换）
+
+批次开始时在输出目录中写入日志头（全部输入文件和转换参数），之后每完成一个文件追加一行记录。
+记录按批次刷新并调用fsync，既保证掉电或崩溃后最多只丢失最近几条记录，又不会拖慢转换。
+批次正常结束后日志被删除；如果日志仍然存在，说明上次转换没有完成，可以从中断处继续。
+"""
+
+import os
+import json
+import time
+
+JOURNAL_NAME = ".picture_converter_journal.jsonl"
+JOURNAL_VERSION = 1
+
+
+def journal_path(output_dir):
+    """输出目录中批次日志的路径"""
+    return os.path.join(output_dir, JOURNAL_NAME)
+
+
+def load_unfinished_batch(output_dir):
+    """读取输出目录中未完成的批次
+
+    返回 {"input_files", "params", "done", "remaining_files"}，没有未完成的批次时返回None。
+    最后一行可能因崩溃而不完整，无法解析的行会被忽略。
+    """
+    path = journal_path(output_dir)
+    if not os.path.exists(path):
+        return None
+
+    header = None
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "batch":
+                    header = record
+                elif record.get("type") == "done":
+                    done.add(record["path"])
+    except OSError:
+        return None
+
+    if header is None or header.get("version") != JOURNAL_VERSION:
+        return None
+
+    input_files = header["input_files"]
+    return {
+        "input_files": input_files,
+        "params": header["params"],
+        "done": done,
+        "remaining_files": [f for f in input_files if f not in done],
+    }
+
+
+class BatchJournal:
+    """只追加写入的批次日志"""
+
+    FSYNC_EVERY = 64  # 每写入多少条记录执行一次fsync
+    FSYNC_INTERVAL = 2.0  # 距上次fsync超过多少秒时执行一次fsync
+
+    def __init__(self, output_dir, input_files=None, params=None, resume=False):
+        """创建新的批次日志；resume为True时在已有日志后继续追加"""
+        self.path = journal_path(output_dir)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        if resume:
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write({
+                "type": "batch",
+                "version": JOURNAL_VERSION,
+                "input_files": list(input_files),
+                "params": params,
+            })
+            self.sync()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.FSYNC_EVERY or time.monotonic() - self._last_sync >= self.FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """把缓冲的记录写入磁盘"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def recordDone(self, input_file):
+        """记录文件已完成（包括被跳过的文件）"""
+        self._write({"type": "done", "path": input_file})
+
+    def recordFailed(self, failure):
+        """记录文件转换失败，继续批次时会重新尝试"""
+        self._write({"type": "failed", "path": failure["path"], "stage": failure["stage"], "error": failure["error"]})
+
+    def close(self):
+        """关闭日志并保留文件，以便之后继续"""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def finish(self):
+        """批次已全部处理，删除日志"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
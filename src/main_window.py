@@ -3,9 +3,8 @@
 import os
 import sys
 import json
-import shutil
+from collections import OrderedDict
 from datetime import datetime
-from PIL import Image
 
 # 用于处理资源路径的函数
 def resource_path(relative_path):
@@ -18,138 +17,72 @@ def resource_path(relative_path):
         base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     
     return os.path.join(base_path, relative_path)
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-    # Note: AVIF format uses the same opener as HEIF in current pillow_heif version
-    HEIF_SUPPORT = True
-except ImportError:
-    HEIF_SUPPORT = False
-
-# 检查JXL格式支持
-try:
-    # 首先尝试直接导入PIL的JXL插件
-    from PIL import JxlImagePlugin
-    JXL_SUPPORT = True
-except ImportError:
-    try:
-        # 尝试导入Pillow-JXL-Plugin库
-        from pillow_jxl import JpegXLImagePlugin
-        JXL_SUPPORT = True
-    except ImportError:
-        try:
-            # 尝试导入pillow-jxl库
-            import pillow_jxl
-            pillow_jxl.register_jxl_opener()
-            JXL_SUPPORT = True
-        except ImportError:
-            try:
-                # 尝试另一种可能的导入方式
-                import jpegxl
-                jpegxl.register_jxl_opener()
-                JXL_SUPPORT = True
-            except ImportError:
-                JXL_SUPPORT = False
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QPoint, QRect
+from src.converter import (
+    DEFAULT_ENCODER_PRESET, default_worker_count, is_image_file, normalize_output_targets, render_preview
+)
+from src.engine import BatchConverter
+from src.journal import load_unfinished_batch
+from src.scanner import DirectoryScanner
+from src.thumbnail_cache import ThumbnailCache
+from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QSize, QPoint, QRect, QObject, QRunnable, QThreadPool,
+                          QAbstractListModel, QModelIndex, QTimer)
 from PyQt5.QtGui import QIcon, QPixmap, QPainter, QColor, QBrush, QPen, QFont, QImage, QLinearGradient, QRadialGradient
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                            QPushButton, QFileDialog, QListWidget, QListWidgetItem, QComboBox,
+                            QPushButton, QFileDialog, QListView, QStyledItemDelegate, QComboBox,
                             QSpinBox, QSlider, QProgressBar, QMessageBox, QGroupBox, QCheckBox,
                             QRadioButton, QButtonGroup, QTabWidget, QScrollArea, QSplitter,
                             QFrame, QStyle, QStyleOption, QDesktopWidget, QSizePolicy, QGridLayout,
                             QLineEdit, QTextEdit, QDialog, QDialogButtonBox, QFormLayout, QDoubleSpinBox,
                             QGraphicsDropShadowEffect)
 
+# 各阶段耗时日志的文件名（保存在输出目录中）
+TIMING_LOG_NAME = "conversion_timings.jsonl"
+
 class ImageConverterThread(QThread):
-    """图片转换线程"""
+    """图片转换线程
+
+    实际的转换由 BatchConverter 分发到进程池中并行执行，本线程只负责驱动转换并通过信号汇报进度。
+    """
     progress_updated = pyqtSignal(int)
     conversion_completed = pyqtSignal()
     conversion_failed = pyqtSignal(str)
+    files_failed = pyqtSignal(list)  # 批次结束时发送失败文件列表 [{"path", "stage", "error"}, ...]
+    file_converted = pyqtSignal(dict)  # 每个文件转换完成后发送转换结果（含各阶段耗时和字节数）
     
-    def __init__(self, input_files, output_dir, output_format, quality, resize_option, resize_width, resize_height, parent=None):
+    def __init__(self, input_files, output_dir, output_format, quality, resize_option, resize_width, resize_height, max_workers=None,
+                 overwrite_files=True, incremental=False, continue_on_error=True, resume=False, timing_log=None, memory_budget=None,
+                 output_targets=None, max_bytes=None, pass_through="copy",
+                 encoder_preset=DEFAULT_ENCODER_PRESET, deduplicate="off", prefetch=0, durability="none", parent=None):
         super().__init__(parent)
-        self.input_files = input_files
-        self.output_dir = output_dir
-        self.output_format = output_format
-        self.quality = quality
-        self.resize_option = resize_option
-        self.resize_width = resize_width
-        self.resize_height = resize_height
-        self.is_running = True
+        self.converter = BatchConverter(
+            input_files, output_dir, output_format, quality, resize_option, resize_width, resize_height,
+            max_workers=max_workers, overwrite_files=overwrite_files, incremental=incremental,
+            continue_on_error=continue_on_error, resume=resume, timing_log=timing_log, memory_budget=memory_budget,
+            output_targets=output_targets, max_bytes=max_bytes, pass_through=pass_through,
+            encoder_preset=encoder_preset, deduplicate=deduplicate, prefetch=prefetch, durability=durability
+        )
         self._last_progress_update = 0  # 上次更新进度的时间
         self._progress_update_threshold = 100  # 进度更新阈值（毫秒）
         self._processed_files = 0  # 已处理的文件数
     
+    @property
+    def skipped_files(self):
+        """跳过的文件数"""
+        return self.converter.skipped_files
+    
+    @property
+    def duplicate_files(self):
+        """由内容相同的文件的输出复制得到的文件数"""
+        return self.converter.duplicate_files
+    
     def run(self):
         try:
-            total_files = len(self.input_files)
+            total_files = len(self.converter.input_files)
             start_time = datetime.now()
             
-            for i, input_file in enumerate(self.input_files):
-                if not self.is_running:
-                    break
-                    
-                # 获取文件名（不含扩展名）
-                filename = os.path.splitext(os.path.basename(input_file))[0]
-                output_file = os.path.join(self.output_dir, f"{filename}.{self.output_format.lower()}")
-                
-                # 检查输出目录是否存在，不存在则创建
-                os.makedirs(self.output_dir, exist_ok=True)
-                
-                # 打开图片
-                with Image.open(input_file) as img:
-                    # 处理透明通道（如果是PNG转JPEG）
-                    if img.mode in ('RGBA', 'LA') and self.output_format.lower() == 'jpeg':
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                        img = background
-                    
-                    # 调整大小 - 使用更高效的算法
-                    if self.resize_option == "width":
-                        width_percent = (self.resize_width / float(img.size[0]))
-                        height_size = int((float(img.size[1]) * float(width_percent)))
-                        img = img.resize((self.resize_width, height_size), Image.LANCZOS)
-                    elif self.resize_option == "height":
-                        height_percent = (self.resize_height / float(img.size[1]))
-                        width_size = int((float(img.size[0]) * float(height_percent)))
-                        img = img.resize((width_size, self.resize_height), Image.LANCZOS)
-                    elif self.resize_option == "both":
-                        img = img.resize((self.resize_width, self.resize_height), Image.LANCZOS)
-
-                    
-                    # 保存图片 - 优化保存参数
-                    save_params = {}
-                    if self.output_format.lower() == 'jpeg':
-                        save_params = {'format': 'JPEG', 'quality': self.quality, 'optimize': True}
-                    elif self.output_format.lower() == 'png':
-                        save_params = {'format': 'PNG', 'optimize': True}
-                        # PNG格式不使用quality参数
-                        if 'quality' in save_params:
-                            del save_params['quality']
-                    elif self.output_format.lower() == 'webp':
-                        save_params = {'format': 'WEBP', 'quality': self.quality, 'optimize': True}
-                    elif self.output_format.lower() == 'bmp':
-                        save_params = {'format': 'BMP'}
-                    elif self.output_format.lower() == 'tiff':
-                        save_params = {'format': 'TIFF'}
-                    elif self.output_format.lower() == 'gif':
-                        save_params = {'format': 'GIF'}
-
-
-                    elif self.output_format.lower() == 'avif':
-                        if not HEIF_SUPPORT:
-                            raise Exception("AVIF格式需要安装pillow-heif库支持。请运行: pip install pillow-heif")
-                        save_params = {'format': 'AVIF', 'quality': self.quality}
-                    elif self.output_format.lower() == 'jpeg2000':
-                        save_params = {'format': 'JPEG2000', 'quality': self.quality}
-                    elif self.output_format.lower() == 'tga':
-                        save_params = {'format': 'TGA'}
-                    elif self.output_format.lower() == 'jxl':
-                        if not JXL_SUPPORT:
-                            raise Exception("JXL格式需要安装Pillow-JXL-Plugin库支持。请运行: pip install Pillow-JXL-Plugin")
-                        save_params = {'format': 'JXL', 'quality': self.quality}
-                    
-                    img.save(output_file, **save_params)
+            for result in self.converter.iterResults():
+                if result["status"] == "converted":
+                    self.file_converted.emit(result)
                 
                 # 更新处理文件数
                 self._processed_files += 1
@@ -158,18 +91,37 @@ class ImageConverterThread(QThread):
                 current_time = datetime.now()
                 elapsed_ms = (current_time - start_time).total_seconds() * 1000
                 
-                # 每处理完一个文件或超过阈值时间才更新进度
+                # 处理完所有文件或超过阈值时间才更新进度
                 if self._processed_files == total_files or elapsed_ms - self._last_progress_update >= self._progress_update_threshold:
-                    progress = int((i + 1) / total_files * 100)
+                    progress = int(self._processed_files / total_files * 100)
                     self.progress_updated.emit(progress)
                     self._last_progress_update = elapsed_ms
             
+            if self.converter.failures:
+                self.files_failed.emit(list(self.converter.failures))
             self.conversion_completed.emit()
         except Exception as e:
             self.conversion_failed.emit(str(e))
     
     def stop(self):
-        self.is_running = False
+        self.converter.stop()
+
+class DirectoryScanThread(QThread):
+    """在后台扫描拖入的文件夹，发现的图片文件分批通过信号发送"""
+    files_found = pyqtSignal(list, dict)  # (一批图片文件, 扫描统计)
+    scan_finished = pyqtSignal(dict)  # 扫描统计
+    
+    def __init__(self, paths, sniff=False, parent=None):
+        super().__init__(parent)
+        self.scanner = DirectoryScanner(paths, sniff=sniff)
+    
+    def run(self):
+        for chunk in self.scanner.iterChunks():
+            self.files_found.emit(chunk, self.scanner.stats())
+        self.scan_finished.emit(self.scanner.stats())
+    
+    def stop(self):
+        self.scanner.cancel()
 
 class GlassEffectWidget(QWidget):
     """液态玻璃效果的基础部件"""
@@ -300,29 +252,199 @@ class GlassEffectWidget(QWidget):
         self._needs_background_update = True
         self.update()
 
-class HoverableListWidget(QListWidget):
-    """列表部件"""
+class _ThumbnailSignals(QObject):
+    """缩略图加载任务的信号（QRunnable本身不能发送信号）"""
+    loaded = pyqtSignal(str, QImage)
+
+class _ThumbnailTask(QRunnable):
+    """在后台线程池中生成/读取缩略图"""
+    def __init__(self, thumbnail_cache, file_path, size, signals):
+        super().__init__()
+        self.thumbnail_cache = thumbnail_cache
+        self.file_path = file_path
+        self.size = size
+        self.signals = signals
+    
+    def run(self):
+        thumb_path = self.thumbnail_cache.getThumbnail(self.file_path, self.size)
+        # QImage可以在非GUI线程中创建，QPixmap则只能在GUI线程中创建
+        image = QImage(thumb_path) if thumb_path else QImage()
+        self.signals.loaded.emit(self.file_path, image)
+
+class _PreviewSignals(QObject):
+    """预览渲染任务的信号"""
+    rendered = pyqtSignal(int, object, QImage, object)
+    failed = pyqtSignal(int, str)
+
+class _PreviewTask(QRunnable):
+    """在后台线程中按显示分辨率渲染转换预览"""
+    def __init__(self, request_id, cache_key, input_file, output_format, resize_option, resize_width, resize_height, max_size, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.cache_key = cache_key
+        self.input_file = input_file
+        self.output_format = output_format
+        self.resize_option = resize_option
+        self.resize_width = resize_width
+        self.resize_height = resize_height
+        self.max_size = max_size
+        self.signals = signals
+    
+    def run(self):
+        try:
+            preview_img, output_size = render_preview(
+                self.input_file, self.output_format, self.resize_option,
+                self.resize_width, self.resize_height, self.max_size
+            )
+            # 将PIL图像转换为QImage（copy使QImage持有自己的数据）
+            width, height = preview_img.size
+            if preview_img.mode == 'RGBA':
+                qimage = QImage(preview_img.tobytes(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+            else:
+                qimage = QImage(preview_img.tobytes(), width, height, width * 3, QImage.Format_RGB888).copy()
+            self.signals.rendered.emit(self.request_id, self.cache_key, qimage, output_size)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+
+class ImageListModel(QAbstractListModel):
+    """图片列表模型
+    
+    只有视图实际请求（即可见）的行才会加载缩略图，缩略图在后台线程池中生成，
+    完成后逐个刷新对应的行。内存中只保留最近使用的一部分缩略图。
+    """
+    MAX_CACHED_THUMBNAILS = 2000  # 内存中最多保留的缩略图数量
+    
+    def __init__(self, thumbnail_cache, icon_size, parent=None):
+        super().__init__(parent)
+        self._thumbnail_cache = thumbnail_cache
+        self._icon_size = icon_size
+        self._files = []
+        self._rows = {}  # 文件路径 -> 行号列表（同一文件可能被添加多次）
+        self._thumbnails = OrderedDict()  # 文件路径 -> QPixmap，按最近使用顺序排列
+        self._pending = set()  # 正在加载的文件路径
+        self._failed = set()  # 无法生成缩略图的文件路径
+        self._thread_pool = QThreadPool(self)
+        self._signals = _ThumbnailSignals()
+        self._signals.loaded.connect(self._onThumbnailLoaded)
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._files)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._files):
+            return None
+        file_path = self._files[index.row()]
+        if role == Qt.DecorationRole:
+            pixmap = self._thumbnails.get(file_path)
+            if pixmap is not None:
+                self._thumbnails.move_to_end(file_path)
+                return pixmap
+            self._requestThumbnail(file_path)
+            return None
+        elif role == Qt.ToolTipRole:
+            return file_path
+        return None
+    
+    def filePath(self, row):
+        """获取指定行的文件路径"""
+        return self._files[row]
+    
+    def appendFiles(self, files):
+        """追加文件，只插入行而不加载任何图片，因此可以立即返回"""
+        if not files:
+            return
+        first = len(self._files)
+        self.beginInsertRows(QModelIndex(), first, first + len(files) - 1)
+        for row, file_path in enumerate(files, first):
+            self._files.append(file_path)
+            self._rows.setdefault(file_path, []).append(row)
+        self.endInsertRows()
+    
+    def setFiles(self, files):
+        """重新设置全部文件"""
+        self.beginResetModel()
+        self._files = []
+        self._rows = {}
+        self._failed.clear()
+        self.cancelPending()
+        self.endResetModel()
+        self.appendFiles(list(files))
+    
+    def clear(self):
+        """清空列表"""
+        self.setFiles([])
+    
+    def cancelPending(self):
+        """取消尚未开始的缩略图加载任务（例如滚动后这些行已不可见）"""
+        self._thread_pool.clear()
+        self._pending.clear()
+    
+    def _requestThumbnail(self, file_path):
+        if file_path in self._pending or file_path in self._failed:
+            return
+        self._pending.add(file_path)
+        size = (self._icon_size.width(), self._icon_size.height())
+        self._thread_pool.start(_ThumbnailTask(self._thumbnail_cache, file_path, size, self._signals))
+    
+    def _onThumbnailLoaded(self, file_path, image):
+        self._pending.discard(file_path)
+        if image.isNull():
+            self._failed.add(file_path)
+            return
+        self._thumbnails[file_path] = QPixmap.fromImage(image)
+        while len(self._thumbnails) > self.MAX_CACHED_THUMBNAILS:
+            self._thumbnails.popitem(last=False)
+        for row in self._rows.get(file_path, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """缩略图网格的委托，使用固定的项大小，缩略图加载完成前绘制占位框"""
+    def sizeHint(self, option, index):
+        icon_size = self.parent().iconSize()
+        return QSize(icon_size.width() + 10, icon_size.height() + 10)
+    
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        if index.data(Qt.DecorationRole) is None:
+            painter.save()
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(128, 128, 128, 60))
+            painter.drawRoundedRect(option.rect.adjusted(10, 10, -10, -10), 5, 5)
+            painter.restore()
+
+class HoverableListView(QListView):
+    """图片网格视图"""
     def __init__(self, parent=None):
         super().__init__(parent)
         self._normal_background = QColor(255, 255, 255, 180)
         self._current_background = QColor(self._normal_background)
         self._stylesheet_cache = {}  # 缓存样式表，避免频繁计算
         self._last_theme = None  # 记录上次主题，避免不必要的样式表更新
-        self._selection_timer = None  # 选择动画定时器
-        self._selection_animation = False  # 是否有选择动画
-        self._selection_progress = 0.0  # 选择动画进度
-        self._selection_duration = 150  # 选择动画持续时间
-        self._selection_start_time = 0  # 选择动画开始时间
-        self._selected_item = None  # 当前选中的项
         self._updateStylesheet()  # 初始化样式表
         
         # 启用拖拽功能
         self.setAcceptDrops(True)
         
         # 设置为网格布局以更好地显示图片预览
-        self.setViewMode(QListWidget.IconMode)
-        self.setMovement(QListWidget.Static)
-        self.setResizeMode(QListWidget.Adjust)
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        # 所有项大小相同，布局时无需逐项查询数据
+        self.setUniformItemSizes(True)
+        self.setItemDelegate(ThumbnailDelegate(self))
+        
+        # 滚动后取消不再可见的行的缩略图加载任务
+        self.verticalScrollBar().valueChanged.connect(self._onScrolled)
+    
+    def _onScrolled(self, value):
+        """滚动时丢弃排队中的缩略图任务，重绘后只为可见行重新请求"""
+        if isinstance(self.model(), ImageListModel):
+            self.model().cancelPending()
+            self.viewport().update()
         
     def mouseMoveEvent(self, event):
         """鼠标移动事件"""
@@ -333,10 +455,10 @@ class HoverableListWidget(QListWidget):
         super().mousePressEvent(event)
         
         # 获取点击位置的项
-        item = self.itemAt(event.pos())
+        index = self.indexAt(event.pos())
         
         # 如果点击的是空白区域（没有项）
-        if item is None:
+        if not index.isValid():
             # 改进的MainWindow查找方法
             main_window = None
             current_widget = self
@@ -404,39 +526,19 @@ class HoverableListWidget(QListWidget):
     def dropEvent(self, event):
         """拖拽释放事件"""
         if event.mimeData().hasUrls():
-            urls = event.mimeData().urls()
-            files = []
+            paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
             
-            # 处理拖拽的文件和文件夹
-            for url in urls:
-                path = url.toLocalFile()
-                if os.path.isfile(path):
-                    # 检查文件是否为图片
-                    if self.isImageFile(path):
-                        files.append(path)
-                elif os.path.isdir(path):
-                    # 处理文件夹中的图片
-                    for root, _, file_names in os.walk(path):
-                        for file_name in file_names:
-                            file_path = os.path.join(root, file_name)
-                            if self.isImageFile(file_path):
-                                files.append(file_path)
-            
-            # 如果有有效的图片文件，添加到列表
-            if files:
-                # 找到MainWindow实例
-                main_window = self
-                while main_window and not hasattr(main_window, 'addFilesToInput'):
-                    main_window = main_window.parent()
-                    
-                if main_window:
-                    main_window.addFilesToInput(files)
+            # 找到MainWindow实例，由它处理文件和文件夹（文件夹在后台扫描）
+            main_window = self
+            while main_window and not hasattr(main_window, 'addPaths'):
+                main_window = main_window.parent()
+                
+            if main_window and paths:
+                main_window.addPaths(paths)
                 
     def isImageFile(self, file_path):
         """检查文件是否为图片文件"""
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif', '.webp', '.avif']
-        _, ext = os.path.splitext(file_path.lower())
-        return ext in image_extensions
+        return is_image_file(file_path)
     
     
     
@@ -475,19 +577,19 @@ class HoverableListWidget(QListWidget):
         
         # 构建样式表
         stylesheet = f"""
-            QListWidget {{
+            QListView {{
                 background-color: {base_bg};
                 border: 1px solid {border_color};
                 border-radius: 5px;
                 color: {text_color};
                 outline: none;
             }}
-            QListWidget::item {{
+            QListView::item {{
                 padding: 8px 5px;
                 border-radius: 3px;
                 margin: 1px;
             }}
-            QListWidget::item:selected {{
+            QListView::item:selected {{
                 background-color: {selected_bg};
                 color: {selected_text};
             }}
@@ -502,52 +604,10 @@ class HoverableListWidget(QListWidget):
         # 应用样式表
         self.setStyleSheet(stylesheet)
     
-    def timerEvent(self, event):
-        """定时器事件"""
-        if event.timerId() == self._selection_timer:
-            self._updateSelectionAnimation()
-    
     def setTransparency(self, transparency):
         """设置透明度"""
         self._normal_background.setAlpha(transparency)
         self._updateStylesheet()
-    
-    def _startSelectionAnimation(self, item):
-        """启动选择动画"""
-        self._selected_item = item
-        self._selection_animation = True
-        self._selection_progress = 0.0
-        self._selection_start_time = 0
-        
-        # 停止可能正在运行的选择动画
-        if self._selection_timer:
-            self.killTimer(self._selection_timer)
-        
-        # 启动新的选择动画
-        self._selection_timer = self.startTimer(16)  # 约60fps
-    
-    def _updateSelectionAnimation(self):
-        """更新选择动画进度"""
-        if self._selection_start_time == 0:
-            self._selection_start_time = self._selection_timer
-        
-        elapsed = self._selection_timer - self._selection_start_time
-        self._selection_progress = min(1.0, elapsed / self._selection_duration)
-        
-        # 更新选中项的视觉效果
-        if self._selected_item:
-            # 创建选中项的视觉效果
-            font = self._selected_item.font()
-            font.setBold(True)
-            self._selected_item.setFont(font)
-            
-            # 可以在这里添加更多视觉效果，如颜色变化、缩放等
-        
-        # 动画完成
-        if self._selection_progress >= 1.0:
-            self.killTimer(self._selection_timer)
-            self._selection_timer = None
-            self._selection_animation = False
 
 class HoverableComboBox(QComboBox):
     """下拉框"""
@@ -1234,6 +1294,19 @@ class SettingsDialog(QDialog):
         self.overwrite_checkbox = QCheckBox("覆盖同名文件")
         output_layout.addRow(self.overwrite_checkbox)
         
+        self.incremental_checkbox = QCheckBox("增量转换（跳过已转换且未修改的文件）")
+        output_layout.addRow(self.incremental_checkbox)
+        
+        self.continue_on_error_checkbox = QCheckBox("单个文件出错时继续转换其余文件")
+        output_layout.addRow(self.continue_on_error_checkbox)
+        
+        self.timing_log_checkbox = QCheckBox(f"记录各阶段耗时（输出目录下的 {TIMING_LOG_NAME}）")
+        output_layout.addRow(self.timing_log_checkbox)
+        
+        # 拖入文件夹时，扩展名不是图片的文件按文件头识别（需要读取这些文件，网络共享上较慢）
+        self.sniff_checkbox = QCheckBox("按文件内容识别没有图片扩展名的文件")
+        output_layout.addRow(self.sniff_checkbox)
+        
         # 输出格式
         format_layout = QHBoxLayout()
         format_label = QLabel("输出格式:")
@@ -1259,6 +1332,107 @@ class SettingsDialog(QDialog):
         quality_layout.addWidget(self.output_quality_label)
         output_layout.addRow(quality_layout)
         
+        # 文件大小上限：JPEG/WEBP/AVIF/JXL超出时自动降低质量（以上面的质量为最高质量）
+        max_size_layout = QHBoxLayout()
+        max_size_label = QLabel("文件大小上限:")
+        max_size_layout.addWidget(max_size_label)
+        
+        self.max_output_spin = QSpinBox()
+        self.max_output_spin.setRange(0, 1048576)
+        self.max_output_spin.setSingleStep(50)
+        self.max_output_spin.setSuffix(" KB")
+        self.max_output_spin.setSpecialValueText("不限制")  # 0表示不限制
+        max_size_layout.addWidget(self.max_output_spin)
+        output_layout.addRow(max_size_layout)
+        
+        # 输入已经是目标格式且不需要缩放时，直接复制文件，不再解码和重新编码
+        pass_through_layout = QHBoxLayout()
+        pass_through_label = QLabel("相同格式的文件:")
+        pass_through_layout.addWidget(pass_through_label)
+        
+        self.pass_through_combo = HoverableComboBox()
+        self.pass_through_combo.addItem("直接复制", "copy")
+        self.pass_through_combo.addItem("创建硬链接", "hardlink")
+        self.pass_through_combo.addItem("重新编码", "off")
+        pass_through_layout.addWidget(self.pass_through_combo)
+        output_layout.addRow(pass_through_layout)
+        
+        # 编码预设：在编码速度和输出大小之间取舍（各预设的编码参数见 src.converter.ENCODER_PRESETS）
+        preset_layout = QHBoxLayout()
+        preset_label = QLabel("编码预设:")
+        preset_layout.addWidget(preset_label)
+        
+        self.encoder_preset_combo = HoverableComboBox()
+        self.encoder_preset_combo.addItem("最快（文件较大）", "fastest")
+        self.encoder_preset_combo.addItem("均衡", "balanced")
+        self.encoder_preset_combo.addItem("最小（编码较慢）", "smallest")
+        preset_layout.addWidget(self.encoder_preset_combo)
+        output_layout.addRow(preset_layout)
+        
+        # 去重：内容相同的图片只转换一次，其余的输出直接复制或硬链接
+        dedup_layout = QHBoxLayout()
+        dedup_label = QLabel("内容相同的图片:")
+        dedup_layout.addWidget(dedup_label)
+        
+        self.dedup_combo = HoverableComboBox()
+        self.dedup_combo.addItem("分别转换", "off")
+        self.dedup_combo.addItem("只转换一次，复制输出", "copy")
+        self.dedup_combo.addItem("只转换一次，硬链接输出", "hardlink")
+        dedup_layout.addWidget(self.dedup_combo)
+        output_layout.addRow(dedup_layout)
+        
+        # 并行进程数
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel("并行进程数:")
+        workers_layout.addWidget(workers_label)
+        
+        self.max_workers_spin = QSpinBox()
+        self.max_workers_spin.setRange(0, 256)
+        self.max_workers_spin.setSpecialValueText(f"自动 ({default_worker_count()})")  # 0表示使用CPU核心数
+        workers_layout.addWidget(self.max_workers_spin)
+        output_layout.addRow(workers_layout)
+        
+        # 内存上限：同时转换的图片预计占用的内存超过该值时，等待其他图片完成后再开始
+        memory_layout = QHBoxLayout()
+        memory_label = QLabel("转换内存上限:")
+        memory_layout.addWidget(memory_label)
+        
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(0, 262144)
+        self.memory_budget_spin.setSingleStep(256)
+        self.memory_budget_spin.setSuffix(" MB")
+        self.memory_budget_spin.setSpecialValueText("不限制")  # 0表示不限制
+        memory_layout.addWidget(self.memory_budget_spin)
+        output_layout.addRow(memory_layout)
+        
+        # 预读：在后台提前读取之后要转换的文件，网络共享或机械硬盘上的读取与转换重叠
+        prefetch_layout = QHBoxLayout()
+        prefetch_label = QLabel("预读文件数:")
+        prefetch_layout.addWidget(prefetch_label)
+        
+        self.prefetch_spin = QSpinBox()
+        self.prefetch_spin.setRange(0, 256)
+        self.prefetch_spin.setSpecialValueText("不预读")  # 0表示不预读
+        prefetch_layout.addWidget(self.prefetch_spin)
+        output_layout.addRow(prefetch_layout)
+        
+        # 写入磁盘：输出总是先写临时文件再重命名，这里选择何时把文件同步到磁盘
+        durability_layout = QHBoxLayout()
+        durability_label = QLabel("写入磁盘:")
+        durability_layout.addWidget(durability_label)
+        
+        self.durability_combo = HoverableComboBox()
+        self.durability_combo.addItem("由系统决定（最快）", "none")
+        self.durability_combo.addItem("每批文件同步一次", "batch")
+        self.durability_combo.addItem("每个文件立即同步（最安全）", "file")
+        durability_layout.addWidget(self.durability_combo)
+        output_layout.addRow(durability_layout)
+        
+        # 多种输出：每张图片只解码一次，同时生成多种格式和尺寸的输出
+        self.output_targets_edit = HoverableLineEdit()
+        self.output_targets_edit.setPlaceholderText("如 JPEG:90:width=2048; WEBP:80:width=1024（留空则按下面的格式和尺寸输出）")
+        output_layout.addRow("多种输出:", self.output_targets_edit)
+        
         output_group.setLayout(output_layout)
         glass_layout.addWidget(output_group)
         
@@ -1336,6 +1510,11 @@ class SettingsDialog(QDialog):
         self.transparency_slider.valueChanged.connect(lambda v: self.transparency_label.setText(str(v)))
         ui_layout.addRow("玻璃透明度:", transparency_layout)
         
+        self.thumbnail_cache_spin = QSpinBox()
+        self.thumbnail_cache_spin.setRange(10, 10240)
+        self.thumbnail_cache_spin.setSuffix(" MB")
+        ui_layout.addRow("缩略图缓存上限:", self.thumbnail_cache_spin)
+        
         ui_group.setLayout(ui_layout)
         glass_layout.addWidget(ui_group)
         
@@ -1354,6 +1533,19 @@ class SettingsDialog(QDialog):
         layout.addWidget(glass_container)
         self.setLayout(layout)
     
+    def outputTargets(self):
+        """多种输出的描述列表，如 ["JPEG:90:width=2048", "WEBP:80:width=1024"]"""
+        return [text.strip() for text in self.output_targets_edit.text().replace("；", ";").split(";") if text.strip()]
+    
+    def accept(self):
+        # 检查多种输出的格式
+        try:
+            normalize_output_targets(self.outputTargets())
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"多种输出设置有误：{e}")
+            return
+        super().accept()
+    
     def updateResizeOptions(self):
         # 更新尺寸调整选项的可用状态
         self.output_width_spin.setEnabled(self.resize_width_radio.isChecked() or self.resize_both_radio.isChecked())
@@ -1362,12 +1554,27 @@ class SettingsDialog(QDialog):
     def loadSettings(self):
         # 加载设置
         self.overwrite_checkbox.setChecked(self.settings.get("overwrite_files", False))
+        self.incremental_checkbox.setChecked(self.settings.get("incremental", False))
+        self.continue_on_error_checkbox.setChecked(self.settings.get("continue_on_error", True))
+        self.timing_log_checkbox.setChecked(self.settings.get("timing_log", False))
+        self.sniff_checkbox.setChecked(self.settings.get("sniff_image_headers", False))
         self.theme_combo.setCurrentText(self.settings.get("theme", "浅色"))
         self.transparency_slider.setValue(self.settings.get("glass_transparency", 200))
+        self.thumbnail_cache_spin.setValue(self.settings.get("thumbnail_cache_mb", 200))
         
         # 加载输出设置
         self.output_format_combo.setCurrentText(self.settings.get("output_format", "JPEG"))
         self.output_quality_slider.setValue(self.settings.get("output_quality", 90))
+        self.max_output_spin.setValue(self.settings.get("max_output_kb", 0))
+        self.pass_through_combo.setCurrentIndex(max(0, self.pass_through_combo.findData(self.settings.get("pass_through", "copy"))))
+        preset_index = self.encoder_preset_combo.findData(self.settings.get("encoder_preset", DEFAULT_ENCODER_PRESET))
+        self.encoder_preset_combo.setCurrentIndex(max(0, preset_index))
+        self.dedup_combo.setCurrentIndex(max(0, self.dedup_combo.findData(self.settings.get("deduplicate", "off"))))
+        self.max_workers_spin.setValue(self.settings.get("max_workers", 0))
+        self.memory_budget_spin.setValue(self.settings.get("memory_budget_mb", 0))
+        self.prefetch_spin.setValue(self.settings.get("prefetch_files", 0))
+        self.durability_combo.setCurrentIndex(max(0, self.durability_combo.findData(self.settings.get("durability", "none"))))
+        self.output_targets_edit.setText("; ".join(self.settings.get("output_targets", [])))
         
         # 加载尺寸调整设置
         resize_option = self.settings.get("resize_option", "none")
@@ -1387,11 +1594,25 @@ class SettingsDialog(QDialog):
         # 返回设置
         settings = {
             "overwrite_files": self.overwrite_checkbox.isChecked(),
+            "incremental": self.incremental_checkbox.isChecked(),
+            "continue_on_error": self.continue_on_error_checkbox.isChecked(),
+            "timing_log": self.timing_log_checkbox.isChecked(),
+            "sniff_image_headers": self.sniff_checkbox.isChecked(),
             "theme": self.theme_combo.currentText(),
             "glass_transparency": self.transparency_slider.value(),
+            "thumbnail_cache_mb": self.thumbnail_cache_spin.value(),
             # 输出设置
             "output_format": self.output_format_combo.currentText(),
             "output_quality": self.output_quality_slider.value(),
+            "max_output_kb": self.max_output_spin.value(),
+            "pass_through": self.pass_through_combo.currentData(),
+            "encoder_preset": self.encoder_preset_combo.currentData(),
+            "deduplicate": self.dedup_combo.currentData(),
+            "max_workers": self.max_workers_spin.value(),
+            "memory_budget_mb": self.memory_budget_spin.value(),
+            "prefetch_files": self.prefetch_spin.value(),
+            "durability": self.durability_combo.currentData(),
+            "output_targets": self.outputTargets(),
             # 尺寸调整设置
             "output_width": self.output_width_spin.value(),
             "output_height": self.output_height_spin.value()
@@ -1411,6 +1632,9 @@ class SettingsDialog(QDialog):
 
 class MainWindow(QMainWindow):
     """主窗口"""
+    PREVIEW_CACHE_SIZE = 32  # 缓存最近渲染的预览图数量
+    PREVIEW_DEBOUNCE_MS = 60  # 选择变化后等待多久再开始渲染预览
+    
     def __init__(self):
         print("正在初始化主窗口...")
         super().__init__()
@@ -1426,6 +1650,23 @@ class MainWindow(QMainWindow):
         print("加载设置...")
         self.settings = self.loadSettings()
         
+        # 初始化缩略图缓存
+        self.thumbnail_cache = ThumbnailCache(max_bytes=self.settings.get("thumbnail_cache_mb", 200) * 1024 * 1024)
+        
+        # 初始化预览渲染（后台单线程，带防抖和缓存）
+        self._preview_file = None
+        self._preview_request_id = 0
+        self._preview_cache = OrderedDict()  # 缓存键 -> (QImage, 转换后尺寸)
+        self._preview_pool = QThreadPool(self)
+        self._preview_pool.setMaxThreadCount(1)
+        self._preview_signals = _PreviewSignals()
+        self._preview_signals.rendered.connect(self._onPreviewRendered)
+        self._preview_signals.failed.connect(self._onPreviewFailed)
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(self.PREVIEW_DEBOUNCE_MS)
+        self._preview_timer.timeout.connect(self._startPreviewRender)
+        
         # 初始化UI
         print("初始化UI...")
         self.initUI()
@@ -1433,6 +1674,9 @@ class MainWindow(QMainWindow):
         # 初始化变量
         print("初始化变量...")
         self.input_files = []
+        self.scan_threads = []  # 正在扫描文件夹的线程
+        self.failed_files = []  # 上一批次中转换失败的文件
+        self._last_failures = []
         self.conversion_thread = None
         
         # 应用主题
@@ -1442,6 +1686,9 @@ class MainWindow(QMainWindow):
         # 启用拖拽功能
         self.setAcceptDrops(True)
         
+        # 事件循环启动后检查是否有未完成的批次
+        QTimer.singleShot(0, self.checkUnfinishedBatch)
+        
         print("主窗口初始化完成")
     
     def dragEnterEvent(self, event):
@@ -1457,33 +1704,71 @@ class MainWindow(QMainWindow):
     def dropEvent(self, event):
         """拖拽释放事件"""
         if event.mimeData().hasUrls():
-            urls = event.mimeData().urls()
-            files = []
-            
-            # 处理拖拽的文件和文件夹
-            for url in urls:
-                path = url.toLocalFile()
-                if os.path.isfile(path):
-                    # 检查文件是否为图片
-                    if self.isImageFile(path):
-                        files.append(path)
-                elif os.path.isdir(path):
-                    # 处理文件夹中的图片
-                    for root, _, file_names in os.walk(path):
-                        for file_name in file_names:
-                            file_path = os.path.join(root, file_name)
-                            if self.isImageFile(file_path):
-                                files.append(file_path)
-            
-            # 如果有有效的图片文件，添加到列表
-            if files:
-                self.addFilesToInput(files)
+            paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+            if paths:
+                self.addPaths(paths)
     
     def isImageFile(self, file_path):
         """检查文件是否为图片文件"""
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif', '.webp', '.avif']
-        _, ext = os.path.splitext(file_path.lower())
-        return ext in image_extensions
+        return is_image_file(file_path)
+    
+    def addPaths(self, paths):
+        """添加拖入的文件和文件夹
+        
+        只有文件时直接添加；包含文件夹时在后台线程中扫描，发现的图片分批加入列表，界面不会因为大目录而卡住。
+        """
+        sniff = self.settings.get("sniff_image_headers", False)
+        if not any(os.path.isdir(path) for path in paths):
+            if not sniff:
+                self.addFilesToInput([path for path in paths if os.path.isfile(path) and self.isImageFile(path)])
+                return
+        
+        scan_thread = DirectoryScanThread(paths, sniff=sniff, parent=self)
+        scan_thread.files_found.connect(self._onScanFilesFound)
+        scan_thread.scan_finished.connect(self._onScanFinished)
+        self.scan_threads.append(scan_thread)
+        self.scan_status_label.setText("正在扫描文件夹...")
+        self.scan_status_label.setVisible(True)
+        self.stop_scan_btn.setVisible(True)
+        scan_thread.start()
+    
+    def _onScanFilesFound(self, files, stats):
+        """扫描线程发现了一批图片文件"""
+        scan_thread = self.sender()
+        if scan_thread not in self.scan_threads or scan_thread.scanner.cancelled:
+            return  # 已取消的扫描（取消前已发出的信号）
+        # 只在列表原本为空时选中第一张，避免每批文件都切换预览
+        self.addFilesToInput(files, select_first=not self.input_files)
+        self.scan_status_label.setText(
+            f"正在扫描文件夹... 已找到 {stats['files']} 张图片（已检查 {stats['entries']} 项，{stats['rate']:.0f} 项/秒）"
+        )
+    
+    def _onScanFinished(self, stats):
+        """扫描线程结束"""
+        scan_thread = self.sender()
+        if scan_thread not in self.scan_threads:
+            return
+        self.scan_threads.remove(scan_thread)
+        scan_thread.deleteLater()
+        
+        status = "已停止扫描" if stats["cancelled"] else "扫描完成"
+        text = (f"{status}：找到 {stats['files']} 张图片，检查 {stats['entries']} 项，"
+                f"用时 {stats['elapsed']:.1f} 秒（{stats['rate']:.0f} 项/秒）")
+        if stats["errors"]:
+            text += f"，{stats['errors']} 个文件夹无法读取"
+        self.scan_status_label.setText(text)
+        if not self.scan_threads:
+            self.stop_scan_btn.setVisible(False)
+            QTimer.singleShot(5000, self._hideScanStatus)
+    
+    def _hideScanStatus(self):
+        if not self.scan_threads:
+            self.scan_status_label.setVisible(False)
+    
+    def stopScanning(self):
+        """取消所有正在进行的文件夹扫描，已经加入列表的文件保留"""
+        for scan_thread in self.scan_threads:
+            scan_thread.stop()
     
     def initUI(self):
         print("开始初始化UI...")
@@ -1513,10 +1798,26 @@ class MainWindow(QMainWindow):
         
         # 文件列表
         print("创建文件列表...")
-        self.file_list = HoverableListWidget()
+        self.file_model = ImageListModel(self.thumbnail_cache, QSize(100, 100), self)
+        self.file_list = HoverableListView()
         self.file_list.setAlternatingRowColors(True)
+        self.file_list.setModel(self.file_model)
+        self.file_list.selectionModel().currentChanged.connect(self.onFileSelectionChanged)
         left_layout.addWidget(self.file_list)
         
+        # 文件夹扫描状态（扫描时显示）
+        scan_layout = QHBoxLayout()
+        self.scan_status_label = QLabel()
+        self.scan_status_label.setWordWrap(True)
+        self.scan_status_label.setVisible(False)
+        scan_layout.addWidget(self.scan_status_label, 1)
+        
+        self.stop_scan_btn = GlassButton("停止扫描")
+        self.stop_scan_btn.clicked.connect(self.stopScanning)
+        self.stop_scan_btn.setVisible(False)
+        scan_layout.addWidget(self.stop_scan_btn)
+        left_layout.addLayout(scan_layout)
+        
         # 文件操作按钮
         print("创建文件操作按钮...")
         file_buttons_layout = QHBoxLayout()
@@ -1593,6 +1894,11 @@ class MainWindow(QMainWindow):
         convert_btn.clicked.connect(self.startConversion)
         right_layout.addWidget(convert_btn)
         
+        # 继续未完成的批次
+        resume_btn = GlassButton("继续未完成的转换")
+        resume_btn.clicked.connect(self.resumeBatch)
+        right_layout.addWidget(resume_btn)
+        
         # 进度条
         print("创建进度条...")
         self.progress_bar = QProgressBar()
@@ -1638,109 +1944,135 @@ class MainWindow(QMainWindow):
         self.saveSettings()
     
     def previewConversion(self):
-        """预览转换效果"""
+        """预览转换效果
+        
+        预览在后台线程中渲染。选择快速变化时会先等待一小段时间（防抖），
+        过时的请求会被丢弃，最近渲染过的预览直接从缓存中显示。
+        """
         if not self.input_files:
             QMessageBox.warning(self, "警告", "请先添加要转换的图片文件！")
             return
         
         # 获取当前选中的图片
-        current_item = self.file_list.currentItem()
-        if not current_item:
+        current_index = self.file_list.currentIndex()
+        if not current_index.isValid():
             # 如果没有选中项，使用第一张图片
-            if self.file_list.count() > 0:
-                current_item = self.file_list.item(0)
+            if self.file_model.rowCount() > 0:
+                current_index = self.file_model.index(0)
             else:
                 QMessageBox.warning(self, "警告", "请先添加要转换的图片文件！")
                 return
         
         # 获取图片文件路径
-        index = self.file_list.row(current_item)
+        index = current_index.row()
         if index < len(self.input_files):
-            input_file = self.input_files[index]
+            self._preview_file = self.input_files[index]
             
-            try:
-                # 打开原始图片
-                with Image.open(input_file) as img:
-                    # 创建预览图片的副本
-                    preview_img = img.copy()
-                    
-                    # 应用转换设置
-                    output_format = self.settings.get("output_format", "JPEG")
-                    quality = self.settings.get("output_quality", 90)
-                    resize_option = self.settings.get("resize_option", "none")
-                    output_width = self.settings.get("output_width", 800)
-                    output_height = self.settings.get("output_height", 600)
-                    
-                    # 处理透明通道（如果是PNG转JPEG）
-                    if preview_img.mode in ('RGBA', 'LA') and output_format.lower() == 'jpeg':
-                        background = Image.new('RGB', preview_img.size, (255, 255, 255))
-                        background.paste(preview_img, mask=preview_img.split()[-1] if preview_img.mode == 'RGBA' else None)
-                        preview_img = background
-                    
-                    # 调整大小
-                    if resize_option == "width":
-                        width_percent = (output_width / float(preview_img.size[0]))
-                        height_size = int((float(preview_img.size[1]) * float(width_percent)))
-                        preview_img = preview_img.resize((output_width, height_size), Image.LANCZOS)
-                    elif resize_option == "height":
-                        height_percent = (output_height / float(preview_img.size[1]))
-                        width_size = int((float(preview_img.size[0]) * float(height_percent)))
-                        preview_img = preview_img.resize((width_size, output_height), Image.LANCZOS)
-                    elif resize_option == "both":
-                        preview_img = preview_img.resize((output_width, output_height), Image.LANCZOS)
-                    
-                    # 将PIL图像转换为QPixmap并显示
-                    # 首先将PIL图像转换为QImage
-                    if preview_img.mode == 'RGBA':
-                        qimage = QImage(preview_img.tobytes(), preview_img.size[0], preview_img.size[1], QImage.Format_RGBA8888)
-                    elif preview_img.mode == 'RGB':
-                        qimage = QImage(preview_img.tobytes(), preview_img.size[0], preview_img.size[1], QImage.Format_RGB888)
-                    else:
-                        # 其他模式转换为RGB
-                        preview_img = preview_img.convert('RGB')
-                        qimage = QImage(preview_img.tobytes(), preview_img.size[0], preview_img.size[1], QImage.Format_RGB888)
-                    
-                    # 将QImage转换为QPixmap
-                    pixmap = QPixmap.fromImage(qimage)
-                    
-                    # 创建一个带阴影和圆角的QPixmap
-                    shadow_pixmap = QPixmap(pixmap.size() + QSize(20, 20))
-                    shadow_pixmap.fill(Qt.transparent)
-                    
-                    painter = QPainter(shadow_pixmap)
-                    painter.setRenderHint(QPainter.Antialiasing)
-                    painter.setRenderHint(QPainter.SmoothPixmapTransform)
-                    
-                    # 绘制阴影
-                    shadow_effect = QGraphicsDropShadowEffect()
-                    shadow_effect.setBlurRadius(10)
-                    shadow_effect.setColor(QColor(0, 0, 0, 100))
-                    shadow_effect.setOffset(5, 5)
-                    
-                    # 绘制带圆角的图片
-                    rounded_rect = QRect(10, 10, pixmap.width(), pixmap.height())
-                    painter.setBrush(QBrush(pixmap))
-                    painter.drawRoundedRect(rounded_rect, 10, 10)
-                    painter.end()
-                    
-                    # 缩放预览图以适应预览区域，保持高画质
-                    preview_size = self.preview_label.size()
-                    scaled_pixmap = shadow_pixmap.scaled(preview_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                    
-                    # 显示预览图
-                    self.preview_label.setPixmap(scaled_pixmap)
-                    
-                    # 显示预览信息
-                    info_text = f"预览: {output_format} 格式, 质量: {quality}"
-                    if resize_option != "none":
-                        info_text += f", 尺寸: {preview_img.size[0]}x{preview_img.size[1]}"
-                    self.preview_label.setToolTip(info_text)
-                    
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"预览过程中发生错误：{str(e)}")
+            # 缓存命中时立即显示
+            cache_key = self._previewCacheKey(self._preview_file)
+            if cache_key in self._preview_cache:
+                self._preview_cache.move_to_end(cache_key)
+                self._invalidatePreviewRequests()
+                self._showPreview(*self._preview_cache[cache_key])
+                return
+            
+            # 重新开始防抖计时
+            self._preview_timer.start()
+    
+    def _previewMaxSize(self):
+        """预览区域的物理像素尺寸"""
+        ratio = self.preview_label.devicePixelRatioF()
+        size = self.preview_label.size()
+        return (max(1, int(size.width() * ratio)), max(1, int(size.height() * ratio)))
+    
+    def _previewCacheKey(self, input_file):
+        """预览缓存的键：文件、修改时间、影响预览的转换设置和显示尺寸"""
+        try:
+            mtime = os.path.getmtime(input_file)
+        except OSError:
+            mtime = None
+        return (
+            input_file, mtime,
+            self.settings.get("output_format", "JPEG"),
+            self.settings.get("resize_option", "none"),
+            self.settings.get("output_width", 800),
+            self.settings.get("output_height", 600),
+            self._previewMaxSize()
+        )
+    
+    def _invalidatePreviewRequests(self):
+        """丢弃尚未开始的预览任务，并使正在进行的任务结果失效"""
+        self._preview_request_id += 1
+        self._preview_pool.clear()
+    
+    def _startPreviewRender(self):
+        """防抖结束后提交预览渲染任务"""
+        if not self._preview_file:
+            return
+        self._invalidatePreviewRequests()
+        cache_key = self._previewCacheKey(self._preview_file)
+        self._preview_pool.start(_PreviewTask(
+            self._preview_request_id, cache_key, self._preview_file,
+            self.settings.get("output_format", "JPEG"),
+            self.settings.get("resize_option", "none"),
+            self.settings.get("output_width", 800),
+            self.settings.get("output_height", 600),
+            self._previewMaxSize(),
+            self._preview_signals
+        ))
+    
+    def _onPreviewRendered(self, request_id, cache_key, qimage, output_size):
+        """预览渲染完成"""
+        self._preview_cache[cache_key] = (qimage, output_size)
+        while len(self._preview_cache) > self.PREVIEW_CACHE_SIZE:
+            self._preview_cache.popitem(last=False)
+        
+        # 选择已经变化的过时结果只缓存，不显示
+        if request_id == self._preview_request_id:
+            self._showPreview(qimage, output_size)
+    
+    def _onPreviewFailed(self, request_id, error_msg):
+        if request_id == self._preview_request_id:
+            QMessageBox.critical(self, "错误", f"预览过程中发生错误：{error_msg}")
+    
+    def _showPreview(self, qimage, output_size):
+        """显示渲染好的预览图"""
+        # 将QImage转换为QPixmap
+        pixmap = QPixmap.fromImage(qimage)
+        
+        # 创建一个带阴影和圆角的QPixmap
+        shadow_pixmap = QPixmap(pixmap.size() + QSize(20, 20))
+        shadow_pixmap.fill(Qt.transparent)
+        
+        painter = QPainter(shadow_pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        
+        # 绘制带圆角的图片
+        rounded_rect = QRect(10, 10, pixmap.width(), pixmap.height())
+        painter.setBrush(QBrush(pixmap))
+        painter.drawRoundedRect(rounded_rect, 10, 10)
+        painter.end()
+        
+        # 缩放预览图以适应预览区域，保持高画质
+        preview_size = self.preview_label.size()
+        scaled_pixmap = shadow_pixmap.scaled(preview_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        
+        # 显示预览图
+        self.preview_label.setPixmap(scaled_pixmap)
+        
+        # 显示预览信息
+        output_format = self.settings.get("output_format", "JPEG")
+        quality = self.settings.get("output_quality", 90)
+        info_text = f"预览: {output_format} 格式, 质量: {quality}"
+        if self.settings.get("resize_option", "none") != "none":
+            info_text += f", 尺寸: {output_size[0]}x{output_size[1]}"
+        self.preview_label.setToolTip(info_text)
     
     def clearPreview(self):
         """清除预览"""
+        self._preview_timer.stop()
+        self._invalidatePreviewRequests()
         self.preview_label.clear()
         self.preview_label.setText("暂无预览")
         self.preview_label.setToolTip("")
@@ -1756,75 +2088,37 @@ class MainWindow(QMainWindow):
             self.addFilesToInput(files)
             # 自动预览第一张图片已在addFilesToInput方法中处理
             
-    def addFilesToInput(self, files):
-        # 批量添加文件，减少UI更新次数
+    def addFilesToInput(self, files, select_first=True):
+        # 模型只插入行，缩略图在可见时由后台线程加载，因此添加任意数量的文件都能立即返回
         current_count = len(self.input_files)
         self.input_files.extend(files)
-        
-        # 如果添加了大量文件，只更新一次列表
-        if len(files) > 10:
-            self.updateFileList()
-        else:
-            # 少量文件，逐个添加到列表
-            self.file_list.setUpdatesEnabled(False)  # 临时禁用更新
-            for file_path in files:
-                self.addFileToList(file_path)
-            self.file_list.setUpdatesEnabled(True)  # 重新启用更新
+        self.file_model.appendFiles(files)
         
         # 自动预览第一张添加的图片
-        if self.file_list.count() > 0:
-            self.file_list.setCurrentRow(current_count)  # 选中新添加的第一张图片
-            # 预览会自动触发，因为已经连接了currentItemChanged信号
-            
-    def addFileToList(self, file_path):
-        # 创建列表项
-        item = QListWidgetItem()
-        
-        # 创建预览图
-        pixmap = QPixmap(file_path)
-        if not pixmap.isNull():
-            # 缩放预览图以适应图标大小
-            scaled_pixmap = pixmap.scaled(
-                self.file_list.iconSize(), 
-                Qt.KeepAspectRatio, 
-                Qt.SmoothTransformation
-            )
-            item.setIcon(QIcon(scaled_pixmap))
-        
-        # 设置项的大小
-        item.setSizeHint(QSize(self.file_list.iconSize().width() + 10, self.file_list.iconSize().height() + 10))
-        
-        # 添加到列表
-        self.file_list.addItem(item)
-        
-        # 连接选择变化信号（只需连接一次）
-        if not hasattr(self, '_selection_connected'):
-            self.file_list.currentItemChanged.connect(self.onFileSelectionChanged)
-            self._selection_connected = True
+        if select_first and self.file_model.rowCount() > current_count:
+            self.file_list.setCurrentIndex(self.file_model.index(current_count))  # 选中新添加的第一张图片
+            # 预览会自动触发，因为已经连接了currentChanged信号
     
     def onFileSelectionChanged(self, current, previous):
         """当文件列表选择变化时更新预览"""
-        if current and self.input_files:
-            row = self.file_list.row(current)
+        if current.isValid() and self.input_files:
+            row = current.row()
             if row < len(self.input_files):
                 # 立即预览选中的图片
                 self.previewConversion()
     
     def clearFiles(self):
+        # 清空列表时同时停止扫描，已取消的扫描发送的文件不再加入
+        self.stopScanning()
+        
         # 优化清空文件列表操作
         if self.input_files:  # 只有在有文件时才执行操作
             self.input_files = []
-            self.file_list.clear()  # 直接清空列表，避免调用updateFileList
+            self.file_model.clear()
     
     def updateFileList(self):
-        # 优化文件列表更新，减少UI刷新
-        self.file_list.setUpdatesEnabled(False)  # 临时禁用更新
-        self.file_list.clear()
-        
-        for file_path in self.input_files:
-            self.addFileToList(file_path)
-            
-        self.file_list.setUpdatesEnabled(True)  # 重新启用更新
+        # 按输入文件重新设置模型
+        self.file_model.setFiles(self.input_files)
     
     def browseOutputDir(self):
         dir_path = QFileDialog.getExistingDirectory(self, "选择输出目录")
@@ -1838,30 +2132,93 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "请先添加要转换的图片文件！")
             return
         
+        self._runConversion(self.input_files)
+    
+    def retryFailedFiles(self):
+        """只重新转换上一批次中失败的文件"""
+        if self.failed_files:
+            self._runConversion(self.failed_files)
+    
+    def resumeBatch(self):
+        """继续输出目录中上次未完成的批次"""
+        output_dir = self.output_dir_edit.text()
+        batch = load_unfinished_batch(output_dir) if output_dir else None
+        if batch is None:
+            QMessageBox.information(self, "提示", "输出目录中没有未完成的转换批次。")
+            return
+        
+        self._runConversion(batch["remaining_files"], batch_params=batch["params"], resume=True)
+    
+    def checkUnfinishedBatch(self):
+        """启动时检查输出目录中是否有未完成的批次"""
+        output_dir = self.output_dir_edit.text()
+        batch = load_unfinished_batch(output_dir) if output_dir and os.path.isdir(output_dir) else None
+        if batch is None:
+            return
+        
+        reply = QMessageBox.question(
+            self, "继续转换",
+            f"检测到上次未完成的转换批次（共 {len(batch['input_files'])} 个文件，"
+            f"剩余 {len(batch['remaining_files'])} 个）。是否继续？",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.resumeBatch()
+    
+    def _runConversion(self, input_files, batch_params=None, resume=False):
+        """创建并启动转换线程
+        
+        batch_params为None时使用当前设置，继续未完成的批次时使用批次日志中记录的参数。
+        """
+        if self.conversion_thread and self.conversion_thread.isRunning():
+            QMessageBox.warning(self, "警告", "转换正在进行中！")
+            return
+        
+        self.failed_files = []
+        
         output_dir = self.output_dir_edit.text()
         if not output_dir or not os.path.exists(output_dir):
             QMessageBox.warning(self, "警告", "请选择有效的输出目录！")
             return
         
-        # 确定尺寸调整选项 - 从设置中获取，而不是直接访问UI元素
-        resize_option = self.settings.get("resize_option", "none")
-        output_width = self.settings.get("output_width", 800)
-        output_height = self.settings.get("output_height", 600)
+        if batch_params is None:
+            # 确定转换参数 - 从设置中获取，而不是直接访问UI元素
+            batch_params = {
+                "output_format": self.settings.get("output_format", "JPEG"),
+                "quality": self.settings.get("output_quality", 90),
+                "resize_option": self.settings.get("resize_option", "none"),
+                "resize_width": self.settings.get("output_width", 800),
+                "resize_height": self.settings.get("output_height", 600),
+                "max_bytes": self.settings.get("max_output_kb", 0) * 1024 or None,
+                "pass_through": self.settings.get("pass_through", "copy"),
+                "encoder_preset": self.settings.get("encoder_preset", DEFAULT_ENCODER_PRESET),
+                "deduplicate": self.settings.get("deduplicate", "off"),
+                "overwrite_files": self.settings.get("overwrite_files", False),
+                "incremental": self.settings.get("incremental", False),
+                "continue_on_error": self.settings.get("continue_on_error", True),
+                "output_targets": normalize_output_targets(
+                    self.settings.get("output_targets", []), self.settings.get("output_quality", 90),
+                    self.settings.get("encoder_preset", DEFAULT_ENCODER_PRESET)
+                ) or None,
+            }
         
         # 创建并启动转换线程
         self.conversion_thread = ImageConverterThread(
-            self.input_files,
+            list(input_files),
             output_dir,
-            self.settings.get("output_format", "JPEG"),
-            self.settings.get("output_quality", 90),
-            resize_option,
-            output_width,
-            output_height
+            max_workers=self.settings.get("max_workers", 0),
+            resume=resume,
+            timing_log=os.path.join(output_dir, TIMING_LOG_NAME) if self.settings.get("timing_log", False) else None,
+            memory_budget=self.settings.get("memory_budget_mb", 0) * 1024 * 1024 or None,
+            prefetch=self.settings.get("prefetch_files", 0),
+            durability=self.settings.get("durability", "none"),
+            **batch_params
         )
         
         self.conversion_thread.progress_updated.connect(self.updateProgress)
         self.conversion_thread.conversion_completed.connect(self.conversionCompleted)
         self.conversion_thread.conversion_failed.connect(self.conversionFailed)
+        self.conversion_thread.files_failed.connect(self.onFilesFailed)
         
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
@@ -1873,11 +2230,36 @@ class MainWindow(QMainWindow):
         if self.progress_bar.value() != value:
             self.progress_bar.setValue(value)
     
+    def onFilesFailed(self, failures):
+        """记录本批次失败的文件"""
+        self.failed_files = [failure["path"] for failure in failures]
+        self._last_failures = failures
+    
     def conversionCompleted(self):
         self.progress_bar.setVisible(False)
         
         # 显示转换完成提示
-        QMessageBox.information(self, "完成", "图片转换已完成！")
+        message = "图片转换已完成！"
+        if self.conversion_thread and self.conversion_thread.skipped_files:
+            message += f"\n已跳过 {self.conversion_thread.skipped_files} 个无需转换的文件。"
+        if self.conversion_thread and self.conversion_thread.duplicate_files:
+            message += (f"\n{self.conversion_thread.duplicate_files} 个内容重复的文件直接复制了输出，"
+                        f"节省约 {self.conversion_thread.converter.saved_seconds:.1f} 秒转换时间。")
+        
+        if not self.failed_files:
+            QMessageBox.information(self, "完成", message)
+            return
+        
+        # 部分文件失败：列出失败详情，并提供只重试失败文件的选项
+        message += f"\n其中 {len(self.failed_files)} 个文件转换失败。"
+        box = QMessageBox(QMessageBox.Warning, "完成", message, QMessageBox.Close, self)
+        box.setDetailedText("\n".join(
+            f"{failure['path']} [{failure['stage']}]: {failure['error']}" for failure in self._last_failures
+        ))
+        retry_btn = box.addButton("重试失败的文件", QMessageBox.ActionRole)
+        box.exec_()
+        if box.clickedButton() == retry_btn:
+            self.retryFailedFiles()
     
     def conversionFailed(self, error_msg):
         self.progress_bar.setVisible(False)
@@ -1890,6 +2272,7 @@ class MainWindow(QMainWindow):
         dialog = SettingsDialog(current_settings, self)
         if dialog.exec_() == QDialog.Accepted:
             self.settings = dialog.getSettings()
+            self.thumbnail_cache.max_bytes = self.settings.get("thumbnail_cache_mb", 200) * 1024 * 1024
             self.saveSettings()
             self.applyTheme()
             # 更新输出目录为系统设置中的默认输出目录
@@ -1938,16 +2321,16 @@ class MainWindow(QMainWindow):
                 left: 10px;
                 padding: 0 5px 0 5px;
             }
-            QListWidget {
+            QListView {
                 background-color: rgba(45, 45, 48, 180);
                 border: 1px solid #3F3F46;
                 border-radius: 5px;
                 color: #FFFFFF;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 5px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #007ACC;
             }
             QComboBox, QLineEdit, QSpinBox {
@@ -2026,16 +2409,16 @@ class MainWindow(QMainWindow):
                 left: 10px;
                 padding: 0 5px 0 5px;
             }
-            QListWidget {
+            QListView {
                 background-color: rgba(255, 255, 255, 180);
                 border: 1px solid #CCCCCC;
                 border-radius: 5px;
                 color: #333333;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 5px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #007ACC;
                 color: white;
             }
@@ -2104,7 +2487,7 @@ class MainWindow(QMainWindow):
             widget.setTransparency(transparency)
             
         # 更新新的悬浮效果组件的透明度
-        for list_widget in self.findChildren(HoverableListWidget):
+        for list_widget in self.findChildren(HoverableListView):
             list_widget.setTransparency(transparency)
             
         for combo_box in self.findChildren(HoverableComboBox):
@@ -2118,11 +2501,25 @@ class MainWindow(QMainWindow):
         default_settings = {
             "default_output_dir": os.path.expanduser("~/Pictures"),
             "overwrite_files": False,
+            "incremental": False,
+            "continue_on_error": True,
+            "timing_log": False,
+            "sniff_image_headers": False,
             "theme": "浅色",
             "glass_transparency": 200,
+            "thumbnail_cache_mb": 200,
             # 输出设置
             "output_format": "JPEG",
             "output_quality": 90,
+            "max_output_kb": 0,  # 输出文件大小上限，0表示不限制
+            "pass_through": "copy",  # 相同格式且不需要缩放的文件：copy 直接复制，hardlink 硬链接，off 重新编码
+            "encoder_preset": DEFAULT_ENCODER_PRESET,  # 编码预设：fastest / balanced / smallest
+            "deduplicate": "off",  # 内容相同的图片：off 分别转换，copy 复制输出，hardlink 硬链接输出
+            "max_workers": 0,  # 0表示使用CPU核心数
+            "memory_budget_mb": 0,  # 0表示不限制
+            "prefetch_files": 0,  # 预读文件数，0表示不预读
+            "durability": "none",  # 写入磁盘：none 由系统决定，batch 每批同步一次，file 每个文件立即同步
+            "output_targets": [],  # 多种输出，如 ["JPEG:90:width=2048", "WEBP:80:width=1024"]，为空时按单一格式输出
             # 尺寸调整设置
             "resize_option": "none",
             "output_width": 800,
@@ -2172,6 +2569,22 @@ class MainWindow(QMainWindow):
         except Exception as e:
             print(f"保存设置失败: {e}")
 
+    def closeEvent(self, event):
+        # 如果有转换线程在运行，先停止它
+        if self.conversion_thread and self.conversion_thread.isRunning():
+            self.conversion_thread.stop()
+            self.conversion_thread.wait()
+        
+        # 停止文件夹扫描
+        self.stopScanning()
+        for scan_thread in list(self.scan_threads):
+            scan_thread.wait()
+        
+        # 保存设置
+        self.saveSettings()
+        
+        event.accept()
+
 class AboutDialog(QDialog):
     """关于对话框"""
     def __init__(self, parent=None):
@@ -2293,13 +2706,3 @@ class AboutDialog(QDialog):
     def showAbout(self):
         dialog = AboutDialog(self)
         dialog.exec_()
-    def closeEvent(self, event):
-        # 如果有转换线程在运行，先停止它
-        if self.conversion_thread and self.conversion_thread.isRunning():
-            self.conversion_thread.stop()
-            self.conversion_thread.wait()
-        
-        # 保存设置
-        self.saveSettings()
-        
-        event.accept()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""增量转换清单
+
+清单保存在输出目录中，记录每个输入文件转换时的大小、修改时间和转换参数。
+再次转换时，输入文件和参数都没有变化且输出文件仍然存在的文件可以直接跳过。
+多输出模式下一个输入对应多个输出文件，此时输出路径和参数均为列表。
+"""
+
+import os
+import json
+
+MANIFEST_NAME = ".picture_converter_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _absolute(output_file):
+    """输出路径（或多输出时的路径列表）的绝对路径"""
+    if isinstance(output_file, (list, tuple)):
+        return [os.path.abspath(path) for path in output_file]
+    return os.path.abspath(output_file)
+
+
+def _outputs_exist(output_file):
+    if isinstance(output_file, (list, tuple)):
+        return all(os.path.exists(path) for path in output_file)
+    return os.path.exists(output_file)
+
+
+def file_signature(file_path):
+    """文件签名（大小, 修改时间），用于判断文件是否发生变化"""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ConversionManifest:
+    """输出目录中的转换清单"""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self._entries = {}  # 输入文件绝对路径 -> 记录
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """读取清单，文件不存在或损坏时视为空清单"""
+        self._entries = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self._entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            self._entries = {}
+
+    def save(self):
+        """保存清单（先写临时文件再替换，避免写入中断导致清单损坏）"""
+        if not self._dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def isUpToDate(self, input_file, output_file, params, signature):
+        """输入文件、转换参数都未变化且输出文件存在时返回True"""
+        entry = self._entries.get(os.path.abspath(input_file))
+        return (
+            entry is not None
+            and entry.get("signature") == signature
+            and entry.get("params") == params
+            and entry.get("output") == _absolute(output_file)
+            and _outputs_exist(output_file)
+        )
+
+    def isOwnOutput(self, input_file, output_file):
+        """输出文件是否是之前由该输入文件转换生成的"""
+        entry = self._entries.get(os.path.abspath(input_file))
+        return entry is not None and entry.get("output") == _absolute(output_file)
+
+    def record(self, input_file, output_file, params, signature):
+        """记录一次成功的转换"""
+        self._entries[os.path.abspath(input_file)] = {
+            "signature": signature,
+            "params": params,
+            "output": _absolute(output_file),
+        }
+        self._dirty = True
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""输入文件预读
+
+输入位于网络共享（SMB/NFS）或机械硬盘上时，每个文件打开后都要等待读取，这段时间CPU空闲。
+Prefetcher 在后台线程中提前读取即将转换的文件，读取与前面文件的转换重叠进行。
+
+转换在工作进程中进行，文件内容不在本进程中保存（通过管道传给工作进程反而要多复制一次），
+而是读入操作系统的页缓存：先用 posix_fadvise 通知内核开始预读（支持时），再顺序读取整个文件，
+工作进程打开文件时直接从内存读取。本模块不依赖PyQt5。
+"""
+
+import os
+import sys
+import threading
+from collections import deque
+
+# 已预读但尚未转换完成的文件总大小上限
+DEFAULT_PREFETCH_BYTES = 256 * 1024 * 1024
+
+# 每次读取的字节数
+PREFETCH_CHUNK_BYTES = 1024 * 1024
+
+
+def read_into_cache(file_path):
+    """读取整个文件（内容丢弃），使其进入页缓存，返回读取的字节数"""
+    total = 0
+    with open(file_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass  # 部分文件系统不支持，仍然顺序读取
+        if sys.platform.startswith("linux"):
+            # 由内核把文件内容送到 /dev/null，数据进入页缓存但不必复制到本进程，几乎不占用CPU
+            with open(os.devnull, "wb") as devnull:
+                while True:
+                    count = os.sendfile(devnull.fileno(), f.fileno(), total, PREFETCH_CHUNK_BYTES)
+                    if not count:
+                        break
+                    total += count
+            return total
+        buffer = bytearray(PREFETCH_CHUNK_BYTES)
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            total += count
+    return total
+
+
+class Prefetcher:
+    """按顺序在后台预读文件
+
+    add() 加入即将转换的文件，release() 在文件转换完成（或不再需要）时释放其占用的预读额度。
+    已预读但尚未释放的文件总大小不超过 max_bytes；单个文件超过 max_bytes 时不预读，由工作进程直接读取。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PREFETCH_BYTES, max_workers=1):
+        self.max_bytes = max_bytes
+        self.prefetched_files = 0  # 已预读的文件数
+        self.prefetched_bytes = 0  # 已预读的字节数
+        self._condition = threading.Condition()
+        self._queue = deque()  # 等待预读的文件
+        self._sizes = {}  # 已预读（或正在预读）但尚未释放的文件 -> 大小
+        self._released = set()  # 正在检查大小时就已释放的文件
+        self._bytes_in_use = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._run, name="Prefetcher", daemon=True) for _ in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def add(self, file_path):
+        """加入即将转换的文件"""
+        with self._condition:
+            self._queue.append(file_path)
+            self._condition.notify()
+
+    def release(self, file_path):
+        """文件已转换完成（或不再需要）"""
+        with self._condition:
+            if file_path in self._sizes:
+                self._bytes_in_use -= self._sizes.pop(file_path)
+                self._condition.notify_all()
+            elif file_path in self._queue:
+                self._queue.remove(file_path)
+            else:
+                self._released.add(file_path)
+
+    def close(self):
+        """停止预读，等待正在读取的文件完成"""
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _reserve(self, file_path, size):
+        """等待预读额度，返回是否应该读取该文件"""
+        with self._condition:
+            while True:
+                if self._closed:
+                    return False
+                if file_path in self._released:
+                    self._released.discard(file_path)
+                    return False
+                # 没有其他预读的文件时总是读取，避免额度被单个较大的文件卡住
+                if not self._bytes_in_use or self._bytes_in_use + size <= self.max_bytes:
+                    self._sizes[file_path] = size
+                    self._bytes_in_use += size
+                    return True
+                self._condition.wait()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                file_path = self._queue.popleft()
+
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue  # 无法访问的文件交给转换过程报告错误
+            if size > self.max_bytes or not self._reserve(file_path, size):
+                continue
+            try:
+                read_into_cache(file_path)
+            except OSError:
+                continue
+            with self._condition:
+                self.prefetched_files += 1
+                self.prefetched_bytes += size
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""目录扫描
+
+拖入的文件夹可能位于NAS等网络共享上，包含数百万个文件，逐个目录同步遍历会让界面长时间无响应。
+DirectoryScanner 在线程池中并行扫描各个子目录（os.scandir 一次取得文件类型，无需再逐个 stat），
+发现的图片文件分批产生，调用方可以一边扫描一边显示，也可以随时取消。本模块不依赖PyQt5。
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.converter import IMAGE_EXTENSIONS
+
+# 按文件头识别图片时读取的字节数
+SNIFF_BYTES = 32
+
+# ISO BMFF（AVIF/HEIF）文件头中表示图片的品牌
+IMAGE_BRANDS = (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1")
+
+
+def sniff_image(file_path):
+    """根据文件头判断文件是否为图片（用于没有图片扩展名的文件），无法读取时返回False"""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(SNIFF_BYTES)
+    except OSError:
+        return False
+    return (
+        header.startswith(b"\xff\xd8\xff")  # JPEG
+        or header.startswith(b"\x89PNG\r\n\x1a\n")
+        or header[:6] in (b"GIF87a", b"GIF89a")
+        or header.startswith(b"BM")
+        or header[:4] in (b"II*\x00", b"MM\x00*")  # TIFF
+        or (header.startswith(b"RIFF") and header[8:12] == b"WEBP")
+        or (header[4:8] == b"ftyp" and header[8:12] in IMAGE_BRANDS)
+        or header.startswith(b"\x00\x00\x00\x0cjP  \r\n\x87\n")  # JPEG2000 (JP2)
+        or header.startswith(b"\xff\x4f\xff\x51")  # JPEG2000 码流
+        or header.startswith(b"\xff\x0a")  # JPEG XL 码流
+        or header.startswith(b"\x00\x00\x00\x0cJXL \r\n\x87\n")  # JPEG XL 容器
+    )
+
+
+class DirectoryScanner:
+    """在后台线程池中并行扫描目录，分批产生其中的图片文件
+
+    iterChunks() 每积累 CHUNK_SIZE 个文件或每隔 CHUNK_INTERVAL 秒产生一批文件路径；
+    可以在任意线程调用 cancel() 取消，正在扫描的目录完成后即结束。
+    sniff 为 True 时，扩展名不是图片的文件按文件头识别（需要读取每个这样的文件，较慢）。
+    """
+    CHUNK_SIZE = 1000
+    CHUNK_INTERVAL = 0.2  # 秒
+
+    def __init__(self, paths, recursive=True, sniff=False, max_workers=None):
+        self.paths = list(paths)
+        self.recursive = recursive
+        self.sniff = sniff
+        # 扫描主要在等待文件系统（尤其是网络共享），线程数可以多于CPU核心数
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self.directories = 0  # 已扫描的目录数
+        self.entries = 0  # 已检查的目录项数
+        self.files = 0  # 找到的图片文件数
+        self.errors = 0  # 无法读取的目录数
+        self.elapsed = 0.0  # 扫描用时（秒）
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """取消扫描"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def rate(self):
+        """扫描速度（目录项/秒）"""
+        return self.entries / self.elapsed if self.elapsed > 0 else 0.0
+
+    def stats(self):
+        """扫描统计"""
+        return {
+            "directories": self.directories,
+            "entries": self.entries,
+            "files": self.files,
+            "errors": self.errors,
+            "elapsed": self.elapsed,
+            "rate": self.rate,
+            "cancelled": self.cancelled,
+        }
+
+    def _isImage(self, name, path):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            return True
+        return self.sniff and sniff_image(path)
+
+    def _scanDirectory(self, directory):
+        """扫描单个目录，返回 (图片文件列表, 子目录列表, 目录项数)"""
+        files = []
+        subdirectories = []
+        entries = 0
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                entries += 1
+                try:
+                    # 不跟随符号链接进入目录，避免循环
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file() and self._isImage(entry.name, entry.path):
+                        files.append(entry.path)
+                except OSError:
+                    continue
+                if self.cancelled:
+                    break
+        files.sort()
+        return files, subdirectories, entries
+
+    def iterChunks(self):
+        """执行扫描，分批产生图片文件路径列表"""
+        start = time.perf_counter()
+        chunk = []
+        last_yield = start
+        directories = deque()
+
+        for path in self.paths:
+            if os.path.isdir(path):
+                directories.append(path)
+            elif os.path.isfile(path) and self._isImage(os.path.basename(path), path):
+                chunk.append(path)
+                self.files += 1
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            try:
+                while not self.cancelled:
+                    # 限制同时提交的目录数，目录很多时排队的只是路径
+                    while directories and len(pending) < self.max_workers * 2:
+                        pending.add(executor.submit(self._scanDirectory, directories.popleft()))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, timeout=self.CHUNK_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            files, subdirectories, entries = future.result()
+                        except OSError:
+                            self.errors += 1  # 没有权限或目录已被删除
+                            continue
+                        self.directories += 1
+                        self.entries += entries
+                        self.files += len(files)
+                        chunk.extend(files)
+                        if self.recursive:
+                            directories.extend(subdirectories)
+
+                    now = time.perf_counter()
+                    self.elapsed = now - start
+                    if chunk and (len(chunk) >= self.CHUNK_SIZE or now - last_yield >= self.CHUNK_INTERVAL):
+                        yield chunk
+                        chunk = []
+                        last_yield = now
+            finally:
+                # 取消或提前结束迭代时丢弃尚未开始的目录
+                for future in pending:
+                    future.cancel()
+
+        self.elapsed = time.perf_counter() - start
+        if chunk and not self.cancelled:
+            yield chunk
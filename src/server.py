@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""本地HTTP转换服务
+
+供其他程序通过HTTP调用转换功能，只使用标准库，不依赖PyQt5：
+
+    python -m src.server --port 8765 --settings settings.json
+
+- POST /convert：请求体为图片数据，响应体为转换后的图片。转换参数与设置文件中的同名设置相同，
+  通过查询参数指定，如 /convert?output_format=WEBP&output_quality=80&resize_option=width&output_width=1024，
+  未指定的参数使用 --settings 指定的设置文件中的值。以 --allow-paths 启动时，也可以发送JSON
+  {"path": "本机图片路径", ...}，由服务直接读取该文件（JSON中也可以包含转换参数）。
+- GET /stats：请求数、延迟分位数、吞吐量和各阶段耗时等统计（JSON）。
+
+转换在预先启动的进程池中执行。同时转换的请求数达到上限时，新的请求最多等待 --queue-timeout 秒（默认 QUEUE_TIMEOUT），
+仍然没有空闲时返回503。默认只监听本机地址。
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from src.converter import (
+    DEFAULT_ENCODER_PRESET, ENCODER_PRESETS, OUTPUT_FORMATS, ConversionError, byte_size, convert_image_data,
+    default_worker_count
+)
+from src.engine import start_worker_pool
+
+# 设置文件中的转换参数及其默认值（与图形界面的默认设置相同）
+DEFAULT_PARAMS = {
+    "output_format": "JPEG",
+    "output_quality": 90,
+    "resize_option": "none",
+    "output_width": 800,
+    "output_height": 600,
+    "max_output_kb": 0,
+    "encoder_preset": DEFAULT_ENCODER_PRESET,
+}
+
+RESIZE_OPTIONS = ("none", "width", "height", "both")
+DEFAULT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+
+def load_default_params(settings_file=None):
+    """转换参数的默认值，指定设置文件时使用其中的值"""
+    params = dict(DEFAULT_PARAMS)
+    if settings_file:
+        with open(settings_file, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+        params.update({key: settings[key] for key in DEFAULT_PARAMS if settings.get(key) is not None})
+    return params
+
+
+def parse_conversion_params(values, defaults):
+    """把请求中的转换参数（设置文件中的名称）转换为 convert_image_data 的参数，参数无效时抛出ValueError"""
+    unknown = set(values) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的参数: {', '.join(sorted(unknown))}")
+    merged = dict(defaults, **values)
+
+    def integer(key, minimum, maximum=None):
+        try:
+            value = int(merged[key])
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} 必须是整数") from None
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError(f"{key} 超出范围: {value}")
+        return value
+
+    output_format = str(merged["output_format"]).upper()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {merged['output_format']}")
+    resize_option = merged["resize_option"]
+    if resize_option not in RESIZE_OPTIONS:
+        raise ValueError(f"未知的尺寸调整方式: {resize_option}")
+    encoder_preset = merged["encoder_preset"]
+    if encoder_preset not in ENCODER_PRESETS:
+        raise ValueError(f"未知的编码预设: {encoder_preset}")
+    return {
+        "output_format": output_format,
+        "quality": integer("output_quality", 1, 100),
+        "resize_option": resize_option,
+        "resize_width": integer("output_width", 1),
+        "resize_height": integer("output_height", 1),
+        "max_bytes": integer("max_output_kb", 0) * 1024 or None,
+        "encoder_preset": encoder_preset,
+    }
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class ServiceBusy(Exception):
+    """同时转换的请求数已达上限"""
+
+
+class ServiceStats:
+    """请求统计（线程安全）"""
+    LATENCY_SAMPLES = 1000  # 计算延迟分位数使用的最近请求数
+    THROUGHPUT_WINDOW = 60.0  # 计算吞吐量的时间窗口（秒）
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.converted = 0
+        self.failed = 0
+        self.rejected = 0  # 因并发上限被拒绝的请求数
+        self.in_flight = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stage_seconds = {}  # 转换各阶段耗时之和（秒）
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)  # 最近转换成功的请求的延迟（秒）
+        self._completions = deque()  # 最近转换成功的请求的完成时间和输入字节数
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finish(self, status, latency, bytes_in=0, bytes_out=0, timings=None):
+        """记录一个请求的结果，status 为 "converted" / "failed" / "rejected" """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if status == "converted":
+                self.converted += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+                self._latencies.append(latency)
+                self._completions.append((now, bytes_in))
+                for stage, seconds in (timings or {}).items():
+                    self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            elif status == "rejected":
+                self.rejected += 1
+            else:
+                self.failed += 1
+            while self._completions and now - self._completions[0][0] > self.THROUGHPUT_WINDOW:
+                self._completions.popleft()
+
+    def snapshot(self):
+        """当前统计（可直接序列化为JSON）"""
+        now = time.monotonic()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            recent = [(t, size) for t, size in self._completions if now - t <= self.THROUGHPUT_WINDOW]
+            uptime = time.time() - self.started
+            window = min(self.THROUGHPUT_WINDOW, uptime) or 1.0
+
+            def ms(value):
+                return round(value * 1000, 1) if value is not None else None
+
+            return {
+                "uptime_seconds": round(uptime, 1),
+                "requests": {
+                    "total": self.requests,
+                    "converted": self.converted,
+                    "failed": self.failed,
+                    "rejected": self.rejected,
+                    "in_flight": self.in_flight,
+                },
+                "bytes": {"in": self.bytes_in, "out": self.bytes_out},
+                "latency_ms": {
+                    "samples": len(latencies),
+                    "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+                    "p50": ms(_percentile(latencies, 0.50)),
+                    "p95": ms(_percentile(latencies, 0.95)),
+                    "p99": ms(_percentile(latencies, 0.99)),
+                    "max": ms(latencies[-1] if latencies else None),
+                },
+                "throughput": {
+                    "window_seconds": round(window, 1),
+                    "requests_per_second": round(len(recent) / window, 3),
+                    "input_mb_per_second": round(sum(size for _, size in recent) / window / (1024 * 1024), 3),
+                },
+                "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+            }
+
+
+class ConversionService:
+    """在预先启动的进程池中转换图片，并限制同时转换的请求数"""
+    QUEUE_TIMEOUT = 10.0  # 达到并发上限时新的请求默认最多等待的秒数
+
+    def __init__(self, defaults=None, max_workers=None, max_concurrent=None, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES,
+                 allow_paths=False, queue_timeout=QUEUE_TIMEOUT):
+        self.defaults = defaults or dict(DEFAULT_PARAMS)
+        self.max_workers = max_workers or default_worker_count()
+        # 默认每个工作进程排队一个请求，上一张图片编码完成后下一张可以立即开始
+        self.max_concurrent = max_concurrent or self.max_workers * 2
+        self.max_upload_bytes = max_upload_bytes
+        self.queue_timeout = queue_timeout  # 0表示达到并发上限时立即拒绝
+        self.allow_paths = allow_paths  # 是否允许按本机路径转换（服务可以读取运行它的用户能读取的任何文件）
+        self.stats = ServiceStats()
+        self.executor = start_worker_pool(self.max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._pool_lock = threading.Lock()
+        Image.init()  # 加载全部格式插件，用于查询输出格式的MIME类型
+
+    def mimeType(self, output_format):
+        return Image.MIME.get(output_format, "application/octet-stream")
+
+    def convert(self, source, params):
+        """转换文件路径或图片数据，返回 (输出数据, 转换结果)
+
+        并发数达到上限且等待超时时抛出ServiceBusy，转换失败时抛出ConversionError。
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ServiceBusy()
+        try:
+            executor = self.executor
+            try:
+                return executor.submit(convert_image_data, source, **params).result()
+            except BrokenProcessPool:
+                self._replacePool(executor)
+                raise ConversionError(source if isinstance(source, str) else "<数据>", "worker", "转换进程异常退出") from None
+        finally:
+            self._slots.release()
+
+    def _replacePool(self, broken):
+        """工作进程异常退出后进程池不再可用，换一个新的进程池（多个请求同时发现时只换一次）"""
+        with self._pool_lock:
+            if self.executor is broken:
+                broken.shutdown(wait=False)
+                self.executor = start_worker_pool(self.max_workers)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """处理 /convert 和 /stats 请求"""
+    server_version = "PictureConverter/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sendJson(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send(code, body, "application/json; charset=utf-8", headers)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/stats":
+            service = self.server.service
+            stats = service.stats.snapshot()
+            stats["workers"] = service.max_workers
+            stats["max_concurrent"] = service.max_concurrent
+            stats["queue_timeout"] = service.queue_timeout
+            self._sendJson(200, stats)
+        else:
+            self._sendJson(404, {"error": "未知的路径"})
+
+    def _readRequest(self, url, service):
+        """读取请求，返回 (转换的文件路径或图片数据, 转换参数)"""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        values = {key: items[-1] for key, items in parse_qs(url.query).items()}
+
+        if self.headers.get_content_type() == "application/json":
+            if not service.allow_paths:
+                raise PermissionError("服务未允许按路径转换（启动时加 --allow-paths）")
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict) or not isinstance(payload.get("path"), str):
+                raise ValueError("JSON请求需要包含 path")
+            source = payload.pop("path")
+            if not os.path.isfile(source):
+                raise ValueError(f"文件不存在: {source}")
+            values.update(payload)
+        else:
+            if not body:
+                raise ValueError("请求体为空")
+            source = body
+        return source, parse_conversion_params(values, service.defaults)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self._sendJson(404, {"error": "未知的路径"})
+            return
+
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > service.max_upload_bytes:
+            # 不读取请求体，回应后关闭连接
+            self.close_connection = True
+            self._sendJson(413 if length > 0 else 400, {"error": "请求体过大或长度无效"})
+            return
+
+        start = time.perf_counter()
+        service.stats.begin()
+        status, bytes_in, data, timings = "failed", 0, b"", None
+        try:
+            try:
+                source, params = self._readRequest(url, service)
+                data, result = service.convert(source, params)
+            except PermissionError as e:
+                self._sendJson(403, {"error": str(e)})
+            except ValueError as e:
+                self._sendJson(400, {"error": str(e)})
+            except ServiceBusy:
+                status = "rejected"
+                self._sendJson(503, {"error": "服务繁忙，请稍后重试"}, {"Retry-After": "1"})
+            except ConversionError as e:
+                self._sendJson(422, {"error": e.message, "stage": e.stage})
+            else:
+                status, bytes_in, timings = "converted", result["input_bytes"], result["timings"]
+                headers = {"X-Conversion-Ms": f"{sum(timings.values()) * 1000:.1f}"}
+                if "quality" in result:
+                    headers["X-Output-Quality"] = str(result["quality"])
+                self._send(200, data, service.mimeType(result["format"]), headers)
+        finally:
+            service.stats.finish(status, time.perf_counter() - start, bytes_in, len(data), timings)
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """每个连接一个线程；实际的转换在 ConversionService 的进程池中执行"""
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, ConversionRequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.server", description="本地HTTP图片转换服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只允许本机访问）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口（默认8765）")
+    parser.add_argument("--settings", help="从图形界面的设置文件（settings.json）读取默认转换参数")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="转换进程数（默认CPU核心数）")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="同时转换的请求数上限（默认为进程数的2倍），超出时等待，等待超时返回503")
+    parser.add_argument("--queue-timeout", type=float, default=ConversionService.QUEUE_TIMEOUT, metavar="秒",
+                        help=f"达到并发上限时新的请求最多等待的秒数，0表示立即返回503（默认{ConversionService.QUEUE_TIMEOUT:g}）")
+    parser.add_argument("--max-upload", type=byte_size, default=DEFAULT_MAX_UPLOAD_BYTES, metavar="大小",
+                        help="请求体大小上限（默认100MB）")
+    parser.add_argument("--allow-paths", action="store_true", help="允许通过JSON请求转换本机路径的文件")
+    parser.add_argument("--quiet", action="store_true", help="不输出每个请求的日志")
+    args = parser.parse_args(argv)
+
+    try:
+        defaults = load_default_params(args.settings)
+        parse_conversion_params({}, defaults)
+    except (OSError, ValueError) as e:
+        parser.error(f"无效的设置文件: {e}")
+
+    service = ConversionService(
+        defaults, max_workers=args.workers, max_concurrent=args.max_concurrent, max_upload_bytes=args.max_upload,
+        allow_paths=args.allow_paths, queue_timeout=args.queue_timeout
+    )
+    server = ConversionServer((args.host, args.port), service, quiet=args.quiet)
+    # 作为服务运行时由 SIGTERM 停止
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    print(f"转换服务已启动：http://{args.host}:{server.server_address[1]}/convert"
+          f"（{service.max_workers} 个转换进程），按 Ctrl+C 停止", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
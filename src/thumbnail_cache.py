@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""持久化的缩略图缓存
+
+缩略图以PNG格式保存在磁盘上，缓存键由文件路径、文件大小、修改时间和缩略图尺寸共同决定，
+原图被修改后会自动重新生成。缓存总大小超过上限时按最近最少使用（LRU）的顺序淘汰。
+"""
+
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # 默认缓存上限 200MB
+THUMBNAIL_EXT = ".png"
+
+
+def default_cache_dir():
+    """获取默认的缓存目录"""
+    if sys.platform == "win32":
+        base_dir = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base_dir, "PictureConverter", "thumbnails")
+
+
+class ThumbnailCache:
+    """缩略图磁盘缓存（线程安全）"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None  # 缓存键 -> 文件大小，按最近使用顺序排列（延迟加载）
+        self._total_bytes = 0
+
+    def _loadIndex(self):
+        """扫描缓存目录，按修改时间（即最近访问时间）建立LRU索引"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(THUMBNAIL_EXT):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(THUMBNAIL_EXT)], stat.st_size))
+        found.sort()
+
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total_bytes = sum(self._entries.values())
+
+    def _makeKey(self, file_path, size):
+        """由文件路径、大小、修改时间和缩略图尺寸生成缓存键"""
+        stat = os.stat(file_path)
+        raw = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{size[0]}x{size[1]}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _pathForKey(self, key):
+        return os.path.join(self.cache_dir, key + THUMBNAIL_EXT)
+
+    def _evict(self, max_bytes):
+        """淘汰最久未使用的缩略图，直到缓存大小不超过上限"""
+        while self._total_bytes > max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._pathForKey(key))
+            except OSError:
+                pass
+
+    def getThumbnail(self, file_path, size):
+        """返回文件对应缩略图的路径，缓存中没有时生成；无法生成时返回None"""
+        try:
+            key = self._makeKey(file_path, size)
+        except OSError:
+            return None
+        thumb_path = self._pathForKey(key)
+
+        with self._lock:
+            if self._entries is None:
+                self._loadIndex()
+            if key in self._entries:
+                if os.path.exists(thumb_path):
+                    # 命中：移动到LRU末尾，并更新修改时间以便下次启动时保持顺序
+                    self._entries.move_to_end(key)
+                    try:
+                        os.utime(thumb_path)
+                    except OSError:
+                        pass
+                    return thumb_path
+                # 文件被外部删除
+                self._total_bytes -= self._entries.pop(key)
+
+        # 未命中：在锁外生成缩略图，避免阻塞其他线程
+        # 先写入临时文件再重命名，避免其他线程读到不完整的文件
+        tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(file_path) as img:
+                # thumbnail会自动使用解码器的缩小解码（如JPEG的draft）
+                img.thumbnail(size, Image.LANCZOS, reducing_gap=2.0)
+                if img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+                img.save(tmp_path, format="PNG", compress_level=1)
+            os.replace(tmp_path, thumb_path)
+            thumb_bytes = os.path.getsize(thumb_path)
+        except Exception:
+            # 临时文件不在LRU索引中，不会被淘汰，失败时必须删除
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = thumb_bytes
+            self._total_bytes += thumb_bytes
+            self._evict(self.max_bytes)
+
+        return thumb_path
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            if self._entries is None:
+                self._loadIndex()
+            self._evict(0)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""超大图片的分段缩放
+
+扫描仪输出的超大TIFF（例如 30000×40000）完整解码需要数GB内存，整体LANCZOS缩放也非常慢。
+对于由多个未压缩条带或图块组成的TIFF，本模块按行分段解码，每段先做整数倍快速缩小（Image.reduce），
+再用滚动缓冲区逐行做LANCZOS重采样，只有缩放结果会完整保留在内存中。
+内存占用与分段大小成正比，与原图大小无关；结果与整体缩放（resize_image）一致（仅有舍入误差）。
+"""
+
+import math
+import itertools
+
+from PIL import Image, ImageFile
+
+# 像素数达到该值的图片才使用分段缩放
+TILED_MIN_PIXELS = 64_000_000
+
+# 每段解码后的大致字节数
+STRIP_BYTES = 32 * 1024 * 1024
+
+# 支持分段缩放的图像模式
+TILED_MODES = ("L", "LA", "RGB", "RGBA", "CMYK")
+
+# LANCZOS滤波器的半径（以目标像素计）
+LANCZOS_SUPPORT = 3.0
+
+ORIENTATION_TAG = 274
+
+# 与 Image.resize 相同，带透明通道的图像在预乘透明度后再缩放
+PREMULTIPLIED_MODES = {"LA": "La", "RGBA": "RGBa"}
+
+
+def supports_tiled_resize(img, target_size):
+    """判断是否可以（并且值得）分段缩放
+
+    要求图片足够大、需要缩小，并且是由多个未压缩条带或图块组成的TIFF（压缩的TIFF由libtiff整体解码，无法分段）。
+    必须在图像数据被加载之前调用。
+    """
+    if target_size is None or img.size[0] * img.size[1] < TILED_MIN_PIXELS:
+        return False
+    if target_size[0] > img.size[0] or target_size[1] > img.size[1]:
+        return False
+    if img.format != "TIFF" or img.mode not in TILED_MODES:
+        return False
+    if getattr(img, "use_load_libtiff", True) or not all(tile[0] == "raw" for tile in img.tile):
+        return False
+    # 带旋转信息的图片在加载后会被整体旋转，不能分段处理
+    if img.tag_v2.get(ORIENTATION_TAG, 1) != 1:
+        return False
+    return len(_split_tiles(img)) > 1
+
+
+def strip_memory(img):
+    """分段缩放时一段图像占用的内存（字节）"""
+    row_bytes = img.size[0] * len(img.getbands())
+    return max(STRIP_BYTES, row_bytes)
+
+
+def _make_tile(name, extents, offset, args):
+    """创建tile描述（新版Pillow要求使用ImageFile._Tile）"""
+    if hasattr(ImageFile, "_Tile"):
+        return ImageFile._Tile(name, extents, offset, args)
+    return (name, extents, offset, args)
+
+
+def _split_tiles(img):
+    """把超过STRIP_BYTES的整行条带拆分为多个较小的条带
+
+    只拆分每像素整字节、从上到下存储的未压缩条带（例如整幅图像只有一个条带的TIFF），
+    拆分后的每一部分从文件中对应的偏移开始读取。
+    """
+    width = img.size[0]
+    row_bytes = width * len(img.getbands())
+    rows_per_piece = max(1, -(-STRIP_BYTES // row_bytes))
+    tiles = []
+    for name, extents, offset, args in img.tile:
+        x0, y0, x1, y1 = extents
+        splittable = (
+            x0 == 0 and x1 == width and isinstance(args, tuple) and len(args) >= 3
+            and args[0] == img.mode and args[1] == 0 and args[2] == 1
+        )
+        if not splittable or y1 - y0 <= rows_per_piece:
+            tiles.append(_make_tile(name, extents, offset, args))
+            continue
+        for top in range(y0, y1, rows_per_piece):
+            bottom = min(y1, top + rows_per_piece)
+            tiles.append(_make_tile(name, (0, top, width, bottom), offset + (top - y0) * row_bytes, args))
+    return tiles
+
+
+def _row_groups(img):
+    """把条带/图块按所在的行分组，每组解码后约为STRIP_BYTES字节
+
+    产生 (起始行, 结束行, 该组的tile列表)。
+    """
+    row_bytes = img.size[0] * len(img.getbands())
+    rows = {}
+    for tile in _split_tiles(img):
+        extents = tile[1]
+        rows.setdefault((extents[1], extents[3]), []).append(tile)
+
+    top = None
+    tiles = []
+    for y0, y1 in sorted(rows):
+        if top is None:
+            top = y0
+        tiles.extend(rows[(y0, y1)])
+        if (y1 - top) * row_bytes >= STRIP_BYTES:
+            yield top, y1, tiles
+            top = None
+            tiles = []
+    if tiles:
+        yield top, y1, tiles
+
+
+def _decode_rows(input_file, top, bottom, tiles):
+    """只解码原图中 [top, bottom) 行"""
+    # 通过文件对象打开，避免Pillow把整个文件映射到内存（mmap）
+    with open(input_file, "rb") as f, Image.open(f) as band:
+        # TIFF按 _tile_size 分配解码缓冲区，需要与尺寸一起修改
+        band._size = band._tile_size = (band.size[0], bottom - top)
+        band.tile = [
+            _make_tile(name, (extents[0], extents[1] - top, extents[2], extents[3] - top), offset, args)
+            for name, extents, offset, args in tiles
+        ]
+        band.load()
+        # 直接使用解码结果，不再复制一份
+        return band._new(band.im)
+
+
+def _stack(upper, lower):
+    """上下拼接两段图像"""
+    img = Image.new(upper.mode, (upper.width, upper.height + lower.height))
+    img.paste(upper, (0, 0))
+    img.paste(lower, (0, upper.height))
+    return img
+
+
+def _reduce(img, factor, box=None):
+    if factor == (1, 1):
+        return img.crop(box) if box is not None else img
+    return img.reduce(factor, box)
+
+
+def _reduced_strips(strips, factor):
+    """对逐段解码的图像做整数倍缩小
+
+    缩小块必须与整幅图像对齐，因此每段只处理行数为缩小倍数整数倍的部分，
+    剩余不足一块的行与下一段开头的几行拼成一块。
+    """
+    carry = None
+    for strip in strips:
+        start = 0
+        if carry is not None:
+            start = min(factor[1] - carry.height, strip.height)
+            carry = _stack(carry, strip.crop((0, 0, strip.width, start)))
+            if carry.height < factor[1]:
+                continue
+            yield _reduce(carry, factor)
+            carry = None
+        usable = start + (strip.height - start) // factor[1] * factor[1]
+        if usable > start:
+            yield _reduce(strip, factor, (0, start, strip.width, usable))
+        if usable < strip.height:
+            carry = strip.crop((0, usable, strip.width, strip.height))
+    if carry is not None:
+        yield _reduce(carry, factor)
+
+
+def tiled_resize(img, input_file, target_size, reducing_gap=None, prepare=None, timer=None):
+    """分段解码并缩放超大图片，返回缩放后的图像
+
+    img 为已打开但尚未加载的原图（只用于读取尺寸和条带信息），prepare 对每段解码结果做额外处理
+    （如透明通道处理），timer 为可选的 StageTimer，分别统计 decode/flatten/resize 阶段耗时。
+    """
+    width, height = img.size
+    target_width, target_height = target_size
+
+    def decoded_strips():
+        for top, bottom, tiles in _row_groups(img):
+            if timer is not None:
+                timer.start("decode")
+            strip = _decode_rows(input_file, top, bottom, tiles)
+            if prepare is not None:
+                if timer is not None:
+                    timer.start("flatten")
+                strip = prepare(strip)
+            if timer is not None:
+                timer.start("resize")
+            if strip.mode in PREMULTIPLIED_MODES:
+                strip = strip.convert(PREMULTIPLIED_MODES[strip.mode])
+            yield strip
+
+    strips = decoded_strips()
+    first_strip = next(strips)
+
+    # 与 Image.resize 的 reducing_gap 相同的整数倍缩小倍数（带透明通道的图像不做整数倍缩小）
+    factor = (1, 1)
+    if reducing_gap is not None and first_strip.mode not in PREMULTIPLIED_MODES.values():
+        factor = (int(width / target_width / reducing_gap) or 1, int(height / target_height / reducing_gap) or 1)
+    reduced_rows = math.ceil(height / factor[1])
+    source_width, source_height = width / factor[0], height / factor[1]
+    scale = source_height / target_height
+    # 输出一行需要的源图行数范围（以缩小后的行计）
+    margin = int(math.ceil(LANCZOS_SUPPORT * max(scale, 1.0))) + 1
+
+    output = None
+    buffer = None
+    buffer_top = 0  # 缓冲区第一行在缩小后图像中的位置
+    output_row = 0
+    for strip in _reduced_strips(itertools.chain([first_strip], strips), factor):
+        if output is None:
+            output = Image.new(strip.mode, target_size)
+        buffer = strip if buffer is None else _stack(buffer, strip)
+        buffer_bottom = buffer_top + buffer.height
+
+        # 计算滤波范围已完全落在缓冲区内的输出行
+        if buffer_bottom >= reduced_rows:
+            output_end = target_height
+        else:
+            output_end = min(target_height, int((buffer_bottom - margin) / scale))
+        if output_end > output_row:
+            box = (0, output_row * scale - buffer_top, source_width, output_end * scale - buffer_top)
+            rows = buffer.resize((target_width, output_end - output_row), Image.LANCZOS, box=box)
+            output.paste(rows, (0, output_row))
+            output_row = output_end
+
+        # 丢弃之后不再需要的行
+        keep_top = max(buffer_top, int(output_row * scale) - margin)
+        if keep_top > buffer_top:
+            buffer = buffer.crop((0, keep_top - buffer_top, buffer.width, buffer.height))
+            buffer_top = keep_top
+
+    for mode, premultiplied in PREMULTIPLIED_MODES.items():
+        if output.mode == premultiplied:
+            output = output.convert(mode)
+    return output
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""监视文件夹
+
+持续监视一个或多个输入文件夹，新放入（或被修改）的图片写入完成后自动转换，适合作为长期运行的服务，
+例如扫描仪、相机或其他程序的导入目录。Linux 上使用 inotify（通过ctypes调用，无需额外依赖）；
+其他平台、inotify 不可用或输入位于网络共享上（远程写入不会产生 inotify 事件）时定期扫描目录。
+
+文件是否写入完成：inotify 只报告写入后关闭（IN_CLOSE_WRITE）和移入（IN_MOVED_TO）的文件，
+此外文件的大小和修改时间还需要在 SETTLE_SECONDS 内保持不变。已经写入完成的文件合并成批，
+交给常驻的进程池转换，工作进程不必为每批重新启动。本模块不依赖PyQt5。
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from src.converter import default_worker_count, is_image_file
+from src.engine import BatchConverter, start_worker_pool
+from src.fileops import DEFAULT_SYNC_EVERY
+from src.manifest import ConversionManifest
+
+# inotify 事件（<sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event 的固定部分：wd, mask, cookie, len，之后是长度为len的文件名
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_BYTES = 64 * 1024
+
+
+def _load_libc():
+    """加载提供 inotify 的C库，不支持时返回None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifySource:
+    """使用 inotify 监视目录，报告写入完成或移入的文件"""
+    mode = "inotify"
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+    def __init__(self, directories, recursive=True, is_excluded=None):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError("当前平台不支持inotify")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.directories = list(directories)
+        self.recursive = recursive
+        self.is_excluded = is_excluded or (lambda path: False)
+        self.watches = {}  # 监视描述符 -> 目录
+        self._changes = []  # 添加监视时发现的已有文件
+        for directory in self.directories:
+            self._addTree(directory)
+
+    def _addTree(self, directory):
+        """监视目录（递归时包括其子目录），其中已有的文件也作为变化报告"""
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            if self.is_excluded(directory):
+                continue
+            # 先添加监视再列出目录，两者之间写入的文件不会遗漏
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                print(f"无法监视目录 {directory}: {os.strerror(errno)}")
+                continue
+            self.watches[wd] = directory
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.recursive:
+                                    stack.append(entry.path)
+                            elif entry.is_file():
+                                self._changes.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"无法读取目录 {directory}: {e}")
+
+    def readChanges(self, timeout):
+        """等待最多 timeout 秒，返回可能已写入完成的文件"""
+        changes, self._changes = self._changes, []
+        ready, _, _ = select.select([self.fd], [], [], 0 if changes else timeout)
+        if not ready:
+            return changes
+
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self.fd, INOTIFY_READ_BYTES)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件太多，内核丢弃了一部分，重新扫描全部目录（已转换的文件会被增量转换跳过）
+                for directory in self.directories:
+                    self._addTree(directory)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)  # 目录已被删除
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._addTree(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changes.append(path)
+
+        changes.extend(self._changes)
+        self._changes = []
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """定期扫描目录，报告新增或大小、修改时间发生变化的文件"""
+    mode = "polling"
+    POLL_INTERVAL = 0.5  # 秒
+
+    def __init__(self, directories, recursive=True, is_excluded=None):
+        self.directories = list(directories)
+        self.recursive = recursive
+        self.is_excluded = is_excluded or (lambda path: False)
+        self.known = {}  # 文件 -> (大小, 修改时间)
+        self._last_poll = None
+
+    def _scan(self):
+        files = {}
+        stack = list(self.directories)
+        while stack:
+            directory = stack.pop()
+            if self.is_excluded(directory):
+                continue
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.recursive:
+                                    stack.append(entry.path)
+                            elif entry.is_file() and is_image_file(entry.name):
+                                stat = entry.stat()
+                                files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError:
+                continue  # 目录已被删除或暂时无法访问
+        return files
+
+    def readChanges(self, timeout):
+        """等待最多 timeout 秒，返回可能已写入完成的文件"""
+        if self._last_poll is not None:
+            remaining = self._last_poll + self.POLL_INTERVAL - time.monotonic()
+            if remaining > 0:
+                time.sleep(min(remaining, timeout))
+                if remaining > timeout:
+                    return []
+        self._last_poll = time.monotonic()
+        files = self._scan()
+        changes = [path for path, key in files.items() if self.known.get(path) != key]
+        self.known = files
+        return changes
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """监视输入文件夹，自动转换写入完成的图片
+
+    iterResults() 持续产生每个文件的转换结果（与 BatchConverter.iterResults() 相同，另外包含
+    latency：从发现文件到转换完成的秒数），直到调用 stop()。batch_params 与 BatchConverter 的同名参数相同；
+    总是使用增量转换并在出错时继续，重新启动后不会重复转换已转换过的文件，修改过的文件会重新转换。
+    启动时文件夹中已有的图片也会被检查。
+
+    转换清单在启动时读取一次，所有批次共用；清单很大时读写整个文件需要较长时间，
+    因此不在每批之后保存，而是在没有待转换的文件时按 MANIFEST_SAVE_SECONDS 的间隔保存，停止时再保存一次。
+    """
+    SETTLE_SECONDS = 0.3  # 文件大小和修改时间保持不变多久后视为写入完成
+    TICK_SECONDS = 0.05  # 检查等待中的文件的间隔
+    IDLE_SECONDS = 0.5  # 没有等待中的文件时检查停止请求的间隔
+    MAX_BATCH = 256  # 每批最多转换的文件数
+    MANIFEST_SAVE_SECONDS = 30.0  # 空闲时保存转换清单的最短间隔
+
+    def __init__(self, directories, output_dir, batch_params, recursive=True, max_workers=None, memory_budget=None,
+                 timing_log=None, polling=False, durability="none", sync_every=DEFAULT_SYNC_EVERY):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.output_dir = output_dir
+        self.batch_params = dict(batch_params, incremental=True, continue_on_error=True)
+        self.max_workers = max_workers or default_worker_count()
+        self.memory_budget = memory_budget
+        self.timing_log = timing_log
+        self.durability = durability  # 输出写入磁盘的方式（src.fileops.DURABILITY_MODES）
+        self.sync_every = sync_every
+        self.converter = None  # 正在转换的批次
+        self.converted_files = 0
+        self.skipped_files = 0
+        self.failed_files = 0
+        self.total_latency = 0.0  # 转换成功的文件的延迟之和（秒）
+        self.max_latency = 0.0
+        self._stopped = threading.Event()
+        self._ready = queue.Queue()  # 写入完成的 (文件, 发现时间)
+        self._thread = None
+        self._manifest = None  # 所有批次共用的转换清单
+        self._manifest_saved_at = time.monotonic()
+
+        # 输出目录在输入目录之中时不监视输出目录，否则转换结果又会被当作新图片
+        self._excluded = os.path.normcase(os.path.abspath(output_dir))
+        source = None
+        if not polling:
+            try:
+                source = InotifySource(self.directories, recursive, self._isExcluded)
+            except OSError as e:
+                print(f"无法使用inotify（{e}），改为定期扫描目录")
+        self.source = source or PollingSource(self.directories, recursive, self._isExcluded)
+
+    @property
+    def mode(self):
+        """监视方式："inotify" 或 "polling" """
+        return self.source.mode
+
+    @property
+    def average_latency(self):
+        return self.total_latency / self.converted_files if self.converted_files else 0.0
+
+    def stop(self):
+        """停止监视；正在转换的批次中已开始的文件完成后结束"""
+        self._stopped.set()
+        if self.converter is not None:
+            self.converter.stop()
+
+    def _isExcluded(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        return path == self._excluded or path.startswith(self._excluded + os.sep)
+
+    def _accept(self, path):
+        """只转换图片文件；忽略隐藏文件（很多程序先写入隐藏的临时文件，完成后再改名）"""
+        name = os.path.basename(path)
+        return not name.startswith(".") and is_image_file(name) and not self._isExcluded(path)
+
+    def _watchLoop(self):
+        """监视线程：读取文件变化，等文件大小和修改时间稳定后放入就绪队列"""
+        candidates = {}  # 文件 -> (大小和修改时间, 最近一次变化的时间, 发现时间)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    changes = self.source.readChanges(self.TICK_SECONDS if candidates else self.IDLE_SECONDS)
+                except OSError as e:
+                    print(f"读取文件夹变化失败: {e}")
+                    time.sleep(self.IDLE_SECONDS)
+                    continue
+                now = time.monotonic()
+                for path in changes:
+                    if self._accept(path) and path not in candidates:
+                        candidates[path] = (None, now, now)
+
+                for path, (key, changed_at, seen_at) in list(candidates.items()):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        del candidates[path]  # 文件已被删除或移走
+                        continue
+                    current = (stat.st_size, stat.st_mtime_ns)
+                    if current != key:
+                        candidates[path] = (current, now, seen_at)
+                    elif now - changed_at >= self.SETTLE_SECONDS:
+                        del candidates[path]
+                        self._ready.put((path, seen_at))
+        finally:
+            self.source.close()
+
+    def _nextBatch(self):
+        """等待下一批写入完成的文件，返回 {文件: 发现时间}；停止时返回None"""
+        while not self._stopped.is_set():
+            try:
+                path, seen_at = self._ready.get(timeout=self.IDLE_SECONDS)
+            except queue.Empty:
+                if time.monotonic() - self._manifest_saved_at >= self.MANIFEST_SAVE_SECONDS:
+                    self._saveManifest()
+                continue
+            batch = {path: seen_at}
+            # 等待期间陆续就绪的文件合并为一批
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    path, seen_at = self._ready.get_nowait()
+                except queue.Empty:
+                    break
+                batch.setdefault(path, seen_at)
+            return batch
+        return None
+
+    def _saveManifest(self):
+        self._manifest_saved_at = time.monotonic()
+        try:
+            self._manifest.save()
+        except OSError as e:
+            print(f"保存转换清单失败: {e}")
+
+    def iterResults(self):
+        """开始监视，逐个产生转换结果，直到调用 stop()"""
+        self._manifest = ConversionManifest(self.output_dir)
+        executor = start_worker_pool(self.max_workers)
+        self._thread = threading.Thread(target=self._watchLoop, name="FolderWatcher", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                batch = self._nextBatch()
+                if batch is None:
+                    break
+                self.converter = BatchConverter(
+                    list(batch), self.output_dir, max_workers=self.max_workers, memory_budget=self.memory_budget,
+                    timing_log=self.timing_log, executor=executor, journal=False, durability=self.durability,
+                    sync_every=self.sync_every, manifest=self._manifest, **self.batch_params
+                )
+                if self._stopped.is_set():
+                    break
+                pool_broken = False
+                for result in self.converter.iterResults():
+                    if result["status"] == "converted":
+                        latency = time.monotonic() - batch[result["input"]]
+                        result["latency"] = latency
+                        self.converted_files += 1
+                        self.total_latency += latency
+                        self.max_latency = max(self.max_latency, latency)
+                    elif result["status"] == "skipped":
+                        self.skipped_files += 1
+                    else:
+                        self.failed_files += 1
+                        pool_broken = pool_broken or result["stage"] == "worker"
+                    yield result
+                self.converter = None
+
+                if pool_broken:
+                    # 工作进程异常退出后进程池不再可用，换一个新的进程池
+                    executor.shutdown(wait=False)
+                    executor = start_worker_pool(self.max_workers)
+        finally:
+            self.stop()
+            executor.shutdown(wait=True)
+            self._thread.join()
+            self._saveManifest()